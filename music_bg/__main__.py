@@ -1,15 +1,24 @@
 import inspect
+import json
+import sys
 from importlib import metadata
 from pathlib import Path
+from typing import List, Optional, Tuple
 
+import dbus
 from loguru import logger
 from PIL.Image import Image
 
 from music_bg.argparse import parse_args
 from music_bg.background import reset_background
+from music_bg.batch import run_batch
+from music_bg.bench import DEFAULT_SIZES, format_results, run_bench
 from music_bg.config import Config
-from music_bg.context import Context
+from music_bg.context import Context, Screen
 from music_bg.dbus.loop import run_loop
+from music_bg.dbus.service import format_status, get_status
+from music_bg.img_processors.geometry import fuse_geometry
+from music_bg.img_processors.plan import build_plan
 from music_bg.logging import init_logger
 
 
@@ -72,33 +81,106 @@ def print_variables(context: Context) -> None:
     """
     print(" Variables ".center(80, "#"))
 
-    context.update_variables()
+    context.update_variables(force=True)
     for name, value in context.variables.items():
         print("-" * 80)
         print(f"name: {name}")
         print(f"value: {value}")
 
 
+def print_plan(context: Context) -> None:
+    """
+    Print render plan of configured layers.
+
+    :param context: current mbg context.
+    """
+    print(" Render plan ".center(80, "#"))
+
+    context.update_variables()
+    plan = build_plan(context.layers, context.variables)
+    if context.config.fuse_geometry:
+        fuse_geometry(plan)
+    for depth, node in plan.nodes():
+        line = f"{'    ' * depth}{node.describe()}"
+        if node.layers:
+            line = f"{line} -> layers: {', '.join(map(str, node.layers))}"
+        print(line)
+    if plan.source_layers:
+        print(f"source image -> layers: {', '.join(map(str, plan.source_layers))}")
+    print("-" * 80)
+    print(f"processor calls: {plan.nodes_count}")
+    print(f"saved by sharing: {plan.saved_invocations}")
+
+
 def show_info(
     context: Context,
     show_processors: bool = False,
     show_variables: bool = False,
+    show_plan: bool = False,
 ) -> None:
     """
     Show information about current context.
 
-    This function shows available processors
-    and variable providers.
+    This function shows available processors,
+    variable providers and render plan.
 
     :param context: mbg context.
     :param show_processors: show information about processors.
     :param show_variables: show information about variables.
+    :param show_plan: show render plan.
     """
     show_version()
     if show_processors:
         print_processors(context)
     if show_variables:
         print_variables(context)
+    if show_plan:
+        print_plan(context)
+
+
+def render_covers(
+    context: Context,
+    inputs: List[str],
+    sizes: Optional[List[Tuple[int, int]]] = None,
+    output_dir: Optional[Path] = None,
+    jobs: Optional[int] = None,
+) -> None:
+    """
+    Render wallpapers of covers and print throughput.
+
+    :param context: mbg context.
+    :param inputs: cover files, directories or glob patterns.
+    :param sizes: screen sizes, connected monitors are used if not set.
+    :param output_dir: directory for rendered wallpapers.
+    :param jobs: number of worker processes.
+    """
+    if sizes:
+        screens = [Screen(width=width, height=height) for width, height in sizes]
+    else:
+        screens = context.render_screens()
+    try:
+        summary = run_batch(context, inputs, screens, output_dir, jobs)
+    except ValueError as exc:
+        logger.error(f"Can't render covers: {exc}")
+        sys.exit(1)
+    print(summary.format())
+
+
+def show_status(as_json: bool = False) -> None:
+    """
+    Show state of the running daemon.
+
+    :param as_json: print status as JSON.
+    """
+    try:
+        status = get_status(dbus.SessionBus())
+    except dbus.DBusException as exc:
+        print(f"Can't get status of the daemon: {exc.get_dbus_message()}")
+        sys.exit(1)
+    if as_json:
+        print(json.dumps(status, indent=2, sort_keys=True))
+    else:
+        print(format_status(status))
 
 
 def main() -> None:
@@ -111,21 +193,53 @@ def main() -> None:
     if args.subparser_name == "gen":
         generate_config(args.config_path)
         return
+    if args.subparser_name == "status":
+        show_status(as_json=args.as_json)
+        return
     context = Context(args.config_path)
     if args.subparser_name == "info":
         show_info(
             context,
             show_processors=args.show_processors,
             show_variables=args.show_vars,
+            show_plan=args.show_plan,
         )
         return
+    if args.subparser_name == "bench":
+        try:
+            results = run_bench(
+                context,
+                sizes=args.sizes or list(DEFAULT_SIZES),
+                covers=args.covers,
+                iterations=args.iterations,
+                processors=args.bench_processors,
+                pipeline=args.bench_pipeline,
+            )
+        finally:
+            context.pool.close()
+        print(format_results(results, as_json=args.as_json))
+        return
     init_logger(context.config.log_level)
+    if args.subparser_name == "render":
+        render_covers(
+            context,
+            args.inputs,
+            sizes=args.sizes,
+            output_dir=args.output_dir,
+            jobs=args.jobs,
+        )
+        return
     logger.debug(f"Using config {args.config_path}")
+    context.log_timings = args.log_timings
+    context.pool.start()
     try:
         run_loop(context)
     except KeyboardInterrupt:
         logger.info("Goodbye!")
         reset_background(context)
+    finally:
+        context.pool.close()
+        context.art_fetcher.close()
 
 
 if __name__ == "__main__":
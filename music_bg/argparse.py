@@ -1,7 +1,7 @@
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, Namespace
 from pathlib import Path
 
-from music_bg.utils import xdg_config_home
+from music_bg.utils import parse_size, xdg_config_home
 
 
 def parse_args() -> Namespace:
@@ -31,6 +31,14 @@ def parse_args() -> Namespace:
         default=False,
     )
 
+    parser.add_argument(
+        "--timings",
+        help="Log timings of rendering stages after every render",
+        action="store_true",
+        default=False,
+        dest="log_timings",
+    )
+
     subparsers = parser.add_subparsers(dest="subparser_name")
 
     gen_parser = subparsers.add_parser(
@@ -59,6 +67,111 @@ def parse_args() -> Namespace:
         dest="show_vars",
     )
 
+    info_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Show how layers are rendered",
+        dest="show_plan",
+    )
+
+    bench_parser = subparsers.add_parser(
+        "bench",
+        help="Measure rendering performance",
+    )
+
+    bench_parser.add_argument(
+        "covers",
+        nargs="*",
+        type=Path,
+        help="Sample album covers. Synthetic cover is used if not set",
+    )
+
+    bench_parser.add_argument(
+        "-s",
+        "--size",
+        action="append",
+        type=parse_size,
+        help="Screen size to render at, e.g. 1920x1080. Can be repeated",
+        dest="sizes",
+    )
+
+    bench_parser.add_argument(
+        "-n",
+        "--iterations",
+        type=int,
+        default=5,
+        help="Number of runs of every benchmark",
+    )
+
+    bench_parser.add_argument(
+        "--no-processors",
+        action="store_false",
+        help="Don't benchmark processors one by one",
+        dest="bench_processors",
+    )
+
+    bench_parser.add_argument(
+        "--no-pipeline",
+        action="store_false",
+        help="Don't benchmark configured pipeline",
+        dest="bench_pipeline",
+    )
+
+    bench_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print results as JSON",
+        dest="as_json",
+    )
+
+    render_parser = subparsers.add_parser(
+        "render",
+        help="Render wallpapers of many covers without D-Bus",
+    )
+
+    render_parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Cover files, directories or glob patterns",
+    )
+
+    render_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Directory for rendered wallpapers. Only render cache is used if not set",
+        dest="output_dir",
+    )
+
+    render_parser.add_argument(
+        "-s",
+        "--size",
+        action="append",
+        type=parse_size,
+        help="Screen size to render at, e.g. 1920x1080. Can be repeated. "
+        "Connected monitors are used if not set",
+        dest="sizes",
+    )
+
+    render_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of worker processes. Defaults to the number of CPUs",
+    )
+
+    status_parser = subparsers.add_parser(
+        "status",
+        help="Show state of the running daemon",
+    )
+
+    status_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print status as JSON",
+        dest="as_json",
+    )
+
     gen_parser.add_argument(
         "-c",
         "--config",
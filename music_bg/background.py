@@ -1,25 +1,47 @@
+import shlex
 import subprocess
+from collections import ChainMap
+from typing import Dict, Optional
 
 from loguru import logger
 
 from music_bg.context import Context
 
 
-def set_background(filename: str, context: Context) -> None:
+def set_background(
+    filename: str,
+    context: Context,
+    outputs: Optional[Dict[str, str]] = None,
+) -> None:
     """
     Update current background.
 
-    :param filename: path to background file.
+    Besides `{out}` set_command can use wallpapers
+    rendered for every monitor:
+
+    * `{outputs[HDMI-1]}` is a wallpaper of the monitor with given name;
+    * `{outs}` are quoted paths of wallpapers of all monitors,
+      separated by spaces.
+
+    :param filename: path to background file of the biggest screen.
     :param context: current mbg context.
+    :param outputs: paths to background files by monitor names.
+        Defaults to the same file for all monitors.
     """
     logger.debug("Setting background")
+    if outputs is None:
+        outputs = {monitor.name: filename for monitor in context.monitors}
     command = context.config.set_command.format_map(
-        {
-            "0": filename,  # for backward compatibility
-            "out": filename,
-            "output": filename,
-            **context.variables,
-        },
+        ChainMap(
+            {
+                "0": filename,  # for backward compatibility
+                "out": filename,
+                "output": filename,
+                "outputs": outputs,
+                "outs": " ".join(shlex.quote(path) for path in outputs.values()),
+            },
+            context.variables,
+        ),
     )
     try:
         subprocess.run(["/bin/sh", "-c", command], check=False).check_returncode()  # noqa: S603
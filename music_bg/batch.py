@@ -0,0 +1,409 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from io import BytesIO
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from PIL import Image
+
+from music_bg.cache import render_key
+from music_bg.context import Context, Screen
+from music_bg.decode import (
+    decode_cover,
+    decode_full,
+    decode_thumbnail,
+    reads_cover,
+)
+from music_bg.img_processors.processor import process_images
+from music_bg.output import save_image
+from music_bg.pool import LayerPool
+from music_bg.utils import xdg_cache_home
+
+COVER_SUFFIXES = frozenset((".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif"))
+INDEX_NAME = ".music_bg-index.jsonl"
+
+# Context of a batch worker process.
+_worker_context: Optional[Context] = None
+
+
+@dataclass
+class CoverResult:
+    """Result of rendering a single cover."""
+
+    path: Path
+    digest: str
+    outputs: List[Path] = field(default_factory=list)
+    # Number of wallpapers taken from the render cache.
+    cached: int = 0
+    duration: float = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    """Totals of a batch render."""
+
+    total: int = 0
+    rendered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    wallpapers: int = 0
+    elapsed: float = 0
+
+    @property
+    def images_per_sec(self) -> float:
+        """Rendered covers per second."""
+        return self.rendered / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """
+        Format totals as human-readable text.
+
+        :return: one-line summary.
+        """
+        return (
+            f"Rendered {self.rendered} of {self.total} covers "
+            f"({self.skipped} skipped, {self.failed} failed, "
+            f"{self.wallpapers} wallpapers) in {self.elapsed:.1f}s, "
+            f"{self.images_per_sec:.2f} images/sec"
+        )
+
+
+def find_covers(inputs: Iterable[str]) -> List[Path]:
+    """
+    Expand inputs into cover files.
+
+    Every input is a file, a directory which
+    is searched recursively or a glob pattern.
+
+    :param inputs: files, directories or patterns.
+    :return: sorted unique cover files.
+    """
+    covers = set()
+    for raw_input in inputs:
+        path = Path(raw_input).expanduser()
+        if path.is_file():
+            covers.add(path)
+            continue
+        if path.is_dir():
+            candidates: Iterable[Path] = path.rglob("*")
+        elif path.is_absolute():
+            candidates = Path(path.anchor).glob(str(path.relative_to(path.anchor)))
+        else:
+            candidates = Path().glob(str(path))
+        covers.update(
+            candidate
+            for candidate in candidates
+            if candidate.suffix.lower() in COVER_SUFFIXES and candidate.is_file()
+        )
+    return sorted(covers)
+
+
+def pipeline_fingerprint(context: Context, screens: List[Screen]) -> bytes:
+    """
+    Serialize everything that affects wallpapers except the cover.
+
+    :param context: mbg context.
+    :param screens: screens to render for.
+    :return: serialized pipeline.
+    """
+    pipeline = context.config.model_dump(include={"layers", "output"}, mode="json")
+    pipeline["blender"] = context.config.get_blender()
+    pipeline["screens"] = [(screen.width, screen.height) for screen in screens]
+    return json.dumps(pipeline, sort_keys=True).encode()
+
+
+def cover_digest(path: Path, fingerprint: bytes) -> str:
+    """
+    Hash content of a cover together with the pipeline.
+
+    :param path: cover file.
+    :param fingerprint: serialized pipeline.
+    :return: hex digest.
+    """
+    hasher = hashlib.sha256(fingerprint)
+    with path.open("rb") as cover:
+        hasher.update(cover.read())
+    return hasher.hexdigest()
+
+
+class BatchIndex:
+    """
+    Journal of rendered covers.
+
+    Every rendered or failed cover is appended as a JSON line,
+    so an interrupted batch loses at most the last line.
+    Failed covers are rendered again by the next run.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.done: Dict[str, List[str]] = {}
+        # Errors of covers which failed in the last run.
+        self.failed: Dict[str, str] = {}
+
+    def load(self) -> None:
+        """Read rendered covers from the journal."""
+        if not self.path.exists():
+            return
+        with self.path.open() as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                digest = entry["digest"]
+                if "error" in entry:
+                    self.failed[digest] = entry["error"]
+                    self.done.pop(digest, None)
+                else:
+                    self.done[digest] = entry["outputs"]
+                    self.failed.pop(digest, None)
+
+    def is_done(self, digest: str) -> bool:
+        """
+        Check whether all wallpapers of a cover exist.
+
+        :param digest: digest of the cover.
+        :return: True if the cover can be skipped.
+        """
+        outputs = self.done.get(digest, [])
+        return bool(outputs) and all(Path(output).exists() for output in outputs)
+
+    def add(self, result: CoverResult) -> None:
+        """
+        Append rendered or failed cover to the journal.
+
+        :param result: result of the render.
+        """
+        entry: Dict[str, Any] = {"digest": result.digest}
+        if result.error is not None:
+            entry["error"] = result.error
+            self.failed[result.digest] = result.error
+            self.done.pop(result.digest, None)
+        elif result.outputs:
+            entry["outputs"] = [str(output) for output in result.outputs]
+            self.done[result.digest] = entry["outputs"]
+            self.failed.pop(result.digest, None)
+        else:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as journal:
+            journal.write(json.dumps(entry))
+            journal.write("\n")
+
+
+def _init_worker(context: Context) -> None:
+    global _worker_context  # noqa: PLW0603
+    # Batch workers are daemonic and can't have children,
+    # so layers are processed in the worker itself.
+    context.pool = LayerPool(0)
+    _worker_context = context
+
+
+def render_cover(
+    job: Tuple[Path, str],
+    screens: List[Screen],
+    output_dir: Optional[Path] = None,
+) -> CoverResult:
+    """
+    Render wallpapers of a cover in a worker process.
+
+    Wallpapers are stored in the render cache
+    and copied to the output directory if it's set.
+
+    :param job: cover file and its digest.
+    :param screens: screens to render for.
+    :param output_dir: directory for rendered wallpapers.
+    :return: result of the render.
+    """
+    path, digest = job
+    context = _worker_context
+    result = CoverResult(path=path, digest=digest)
+    if context is None:
+        result.error = "worker is not initialized"
+        return result
+    start = time.perf_counter()
+    try:
+        _render_cover(context, result, screens, output_dir)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        result.error = str(exc)
+    except Exception as exc:
+        # Errors of processors and variables providers
+        # shouldn't stop rendering of other covers.
+        logger.opt(exception=exc).debug(f"Can't render {path}")
+        result.error = f"{type(exc).__name__}: {exc}"
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def _render_cover(
+    context: Context,
+    result: CoverResult,
+    screens: List[Screen],
+    output_dir: Optional[Path],
+) -> None:
+    cover = result.path.read_bytes()
+    thumbnail = decode_thumbnail(cover)
+    context.thumbnail = thumbnail
+    image = decode_full(cover, thumbnail) if reads_cover(context) else None
+    context.src_image = image
+    context.update_variables()
+    if image is None:
+        image = decode_cover(cover, context, screens, thumbnail)
+        context.src_image = image
+    keys = [render_key(image, context, screen) for screen in screens]
+    paths = [context.render_cache.get(key) for key in keys]
+    missing = [index for index, path in enumerate(paths) if path is None]
+    wallpapers = {}
+    if missing:
+        rendered = process_images(image, context, [screens[i] for i in missing])
+        wallpapers = dict(zip(missing, rendered, strict=True))
+    for index, screen in enumerate(screens):
+        cached = paths[index]
+        output = _output_path(context, result, screen, keys[index], output_dir)
+        if cached is not None:
+            result.cached += 1
+            if output is not None and output != cached:
+                shutil.copyfile(cached, output)
+        elif index in wallpapers:
+            _store(context, wallpapers[index], keys[index], output)
+        if output is not None:
+            result.outputs.append(output)
+
+
+def _output_path(
+    context: Context,
+    result: CoverResult,
+    screen: Screen,
+    key: str,
+    output_dir: Optional[Path],
+) -> Optional[Path]:
+    if output_dir is not None:
+        name = f"{result.path.stem}-{result.digest[:8]}-{screen.width}x{screen.height}"
+        return output_dir / f"{name}{context.config.output.suffix}"
+    if context.render_cache.enabled:
+        return context.render_cache.path(key)
+    return None
+
+
+def _store(
+    context: Context,
+    wallpaper: Image.Image,
+    key: str,
+    output: Optional[Path],
+) -> None:
+    config = context.config.output
+    if output is not None and output.parent != context.render_cache.directory:
+        save_image(wallpaper, output, config)
+        context.render_cache.put(key, output)
+        return
+    if not context.render_cache.enabled:
+        # Nothing to store, the wallpaper is only encoded.
+        save_image(wallpaper, BytesIO(), config)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir) / f"wallpaper{config.suffix}"
+        save_image(wallpaper, tmp_path, config)
+        context.render_cache.put(key, tmp_path)
+
+
+def _iter_results(
+    context: Context,
+    jobs: List[Tuple[Path, str]],
+    screens: List[Screen],
+    output_dir: Optional[Path],
+    workers: int,
+) -> Iterator[CoverResult]:
+    render = partial(render_cover, screens=screens, output_dir=output_dir)
+    with Pool(workers, initializer=_init_worker, initargs=(context,)) as pool:
+        yield from pool.imap_unordered(render, jobs)
+
+
+def run_batch(
+    context: Context,
+    inputs: Iterable[str],
+    screens: List[Screen],
+    output_dir: Optional[Path] = None,
+    workers: Optional[int] = None,
+) -> BatchSummary:
+    """
+    Render wallpapers of many covers without D-Bus.
+
+    Covers are distributed between worker processes,
+    every worker renders a whole cover at once.
+    Rendered covers are recorded in a journal
+    by digests of their content and the pipeline,
+    so the next run skips them.
+
+    :param context: mbg context.
+    :param inputs: cover files, directories or glob patterns.
+    :param screens: screens to render for.
+    :param output_dir: directory for rendered wallpapers.
+        If not set, wallpapers are only stored in the render cache.
+    :param workers: number of worker processes,
+        defaults to the number of CPUs.
+    :raises ValueError: if config has no layers.
+    :return: totals of the render.
+    """
+    if not context.config.layers:
+        raise ValueError("No layers to render")
+    start = time.perf_counter()
+    covers = find_covers(inputs)
+    summary = BatchSummary(total=len(covers))
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        index = BatchIndex(output_dir / INDEX_NAME)
+    else:
+        index = BatchIndex(xdg_cache_home() / "music_bg" / "batch-index.jsonl")
+    index.load()
+    cache = context.render_cache
+    if cache.enabled and len(covers) * len(screens) > cache.max_entries:
+        logger.warning(
+            f"Render cache holds only {cache.max_entries} wallpapers, "
+            "increase render_cache.max_entries to keep all of them",
+        )
+
+    fingerprint = pipeline_fingerprint(context, screens)
+    jobs = []
+    for path in covers:
+        digest = cover_digest(path, fingerprint)
+        if index.is_done(digest):
+            summary.skipped += 1
+        else:
+            jobs.append((path, digest))
+    logger.info(
+        f"Rendering {len(jobs)} covers, {summary.skipped} are already rendered",
+    )
+    if not jobs:
+        summary.elapsed = time.perf_counter() - start
+        return summary
+
+    workers = max(min(workers or os.cpu_count() or 1, len(jobs)), 1)
+    for done, result in enumerate(
+        _iter_results(context, jobs, screens, output_dir, workers),
+        start=1,
+    ):
+        index.add(result)
+        if result.error is not None:
+            summary.failed += 1
+            logger.warning(f"Can't render {result.path}: {result.error}")
+            continue
+        summary.rendered += 1
+        summary.wallpapers += len(screens)
+        logger.info(
+            f"[{done}/{len(jobs)}] {result.path} in {result.duration:.2f}s"
+            + (f", {result.cached} from cache" if result.cached else ""),
+        )
+    summary.elapsed = time.perf_counter() - start
+    return summary
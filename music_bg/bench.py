@@ -0,0 +1,424 @@
+from __future__ import annotations
+
+import json
+import math
+import resource
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from music_bg.config import ImageProcessor, OutputConfig, OutputFormat
+from music_bg.context import Context, Screen
+from music_bg.decode import (
+    decode_cover,
+    decode_full,
+    decode_thumbnail,
+    reads_cover,
+)
+from music_bg.img_processors.compiler import compile_processor
+from music_bg.img_processors.geometry import apply_steps, fuse_geometry, transform
+from music_bg.img_processors.plan import build_plan
+from music_bg.img_processors.processor import process_image
+from music_bg.output import save_image
+
+# Arguments for bundled processors which have required arguments.
+PROCESSOR_ARGS: Dict[str, Dict[str, Any]] = {
+    "fit": {"width": "{screen.width}", "height": "{screen.height}"},
+    "blank_image": {"width": "{screen.width}", "height": "{screen.height}"},
+    "print": {"text": "Music Background"},
+    "radial_gradient": {
+        "inner_color": "#FFFFFF",
+        "outer_color": "#000000",
+        "width": "{screen.width}",
+        "height": "{screen.height}",
+    },
+}
+
+DEFAULT_SIZES = ((1920, 1080), (2560, 1440), (3840, 2160))
+
+PROC_STATUS = Path("/proc/self/status")
+PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+@dataclass
+class BenchResult:
+    """Timings of a single benchmark."""
+
+    name: str
+    screen: str
+    samples: List[float] = field(default_factory=list)
+    skipped: Optional[str] = None
+    # Peak resident memory above the one before the benchmark, in megabytes.
+    memory_mb: Optional[float] = None
+
+    @property
+    def p50(self) -> float:
+        """Median time in seconds."""
+        return percentile(self.samples, 50)
+
+    @property
+    def p95(self) -> float:
+        """95th percentile of time in seconds."""
+        return percentile(self.samples, 95)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert result to JSON-serializable dict.
+
+        :return: result with computed percentiles.
+        """
+        result = asdict(self)
+        if self.samples:
+            result.update(p50=self.p50, p95=self.p95)
+        return result
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """
+    Compute percentile with nearest-rank method.
+
+    :param samples: measured values.
+    :param percent: percentile to compute.
+    :return: value of the percentile or NaN if there are no samples.
+    """
+    if not samples:
+        return math.nan
+    ordered = sorted(samples)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def _status_kb(name: str) -> Optional[int]:
+    try:
+        for line in PROC_STATUS.read_text().splitlines():
+            key, _, value = line.partition(":")
+            if key == name:
+                return int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        # Resets peak RSS of the process, see proc(5).
+        PROC_CLEAR_REFS.write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def track_memory(result: BenchResult) -> Iterator[None]:
+    """
+    Measure peak memory of a benchmark.
+
+    Peak RSS of the process is reset before the benchmark,
+    so every benchmark gets its own peak instead of the one
+    of the largest benchmark before it. If it can't be reset,
+    only growth of the lifetime peak is measured.
+    Memory of layer workers isn't counted.
+
+    :param result: result to store the peak in.
+    :yield: nothing.
+    """
+    baseline = _status_kb("VmRSS")
+    if baseline is not None and _reset_peak_rss():
+        yield
+        peak = _status_kb("VmHWM")
+    else:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        yield
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if peak is not None:
+        result.memory_mb = max(peak - baseline, 0) / 1024
+
+
+def synthetic_cover(size: int = 1000, seed: int = 0) -> bytes:
+    """
+    Generate JPEG album cover with gradients and noise.
+
+    :param size: width and height of a cover.
+    :param seed: random seed.
+    :return: encoded image.
+    """
+    rng = np.random.default_rng(seed)
+    coords = np.linspace(0, 1, size, dtype=np.float32)
+    xs, ys = np.meshgrid(coords, coords)
+    channels = [
+        np.sin(xs * rng.uniform(1, 10) + ys * rng.uniform(1, 10)) * 127 + 128
+        for _ in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 12, (size, size, 3))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    encoded = BytesIO()
+    image.save(encoded, format="jpeg", quality=90)
+    return encoded.getvalue()
+
+
+def measure(func: Callable[[], Any], iterations: int) -> List[float]:
+    """
+    Measure time of function calls.
+
+    :param func: function to call.
+    :param iterations: number of calls.
+    :return: duration of every call in seconds.
+    """
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_processor(
+    context: Context,
+    name: str,
+    cover: Image.Image,
+    iterations: int,
+) -> BenchResult:
+    """
+    Benchmark single processor on a cover.
+
+    Processors with required arguments, which
+    are not known to the benchmark, are skipped.
+
+    :param context: mbg context with updated variables.
+    :param name: name of the processor.
+    :param cover: decoded album cover.
+    :param iterations: number of runs.
+    :return: benchmark result.
+    """
+    screen = f"{context.screen.width}x{context.screen.height}"
+    result = BenchResult(name=f"processor:{name}", screen=screen)
+    config = ImageProcessor(name=name, args=PROCESSOR_ARGS.get(name))
+    try:
+        processor = compile_processor(config, context.processors_map)
+    except ValueError as exc:
+        result.skipped = str(exc)
+        return result
+    kwargs = dict(processor.resolve_args(context.variables))
+    try:
+        with track_memory(result):
+            result.samples = measure(
+                lambda: processor.func(cover.copy(), **kwargs),
+                iterations,
+            )
+    except Exception as exc:
+        result.skipped = f"failed: {exc}"
+    return result
+
+
+def bench_pipeline(
+    context: Context,
+    cover: bytes,
+    iterations: int,
+) -> List[BenchResult]:
+    """
+    Benchmark the configured pipeline with per-stage breakdown.
+
+    Memory is measured for the whole pipeline.
+
+    :param context: mbg context.
+    :param cover: encoded album cover.
+    :param iterations: number of runs.
+    :return: results for every stage and the whole pipeline.
+    """
+    screen = f"{context.screen.width}x{context.screen.height}"
+    stages = ("decode", "variables", "layers", "encode", "total")
+    results = {
+        stage: BenchResult(name=f"pipeline:{stage}", screen=screen) for stage in stages
+    }
+    with track_memory(results["total"]):
+        for _ in range(iterations):
+            timings: Dict[str, float] = {}
+
+            start = time.perf_counter()
+            thumbnail = decode_thumbnail(cover)
+            context.thumbnail = thumbnail
+            image = decode_full(cover, thumbnail) if reads_cover(context) else None
+            context.src_image = image
+            timings["decode"] = time.perf_counter() - start
+
+            stage_start = time.perf_counter()
+            context.update_variables()
+            timings["variables"] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            if image is None:
+                image = decode_cover(cover, context, [context.screen], thumbnail)
+                context.src_image = image
+            timings["decode"] += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            processed = process_image(image, context)
+            timings["layers"] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            if processed is not None:
+                save_image(processed, BytesIO(), context.config.output)
+            timings["encode"] = time.perf_counter() - stage_start
+            timings["total"] = time.perf_counter() - start
+
+            for stage, duration in timings.items():
+                results[stage].samples.append(duration)
+    return list(results.values())
+
+
+def _encode(image: Image.Image, output: OutputConfig) -> None:
+    save_image(image, BytesIO(), output)
+
+
+def bench_encoders(
+    context: Context,
+    image: Image.Image,
+    iterations: int,
+) -> List[BenchResult]:
+    """
+    Benchmark encoding of a rendered wallpaper in every output format.
+
+    Format options other than the format itself are taken from config.
+
+    :param context: mbg context.
+    :param image: rendered wallpaper.
+    :param iterations: number of runs.
+    :return: result for every format.
+    """
+    screen = f"{context.screen.width}x{context.screen.height}"
+    results = []
+    for output_format in OutputFormat:
+        output = context.config.output.model_copy(update={"format": output_format})
+        result = BenchResult(name=f"encode:{output_format.value}", screen=screen)
+        with track_memory(result):
+            result.samples = measure(
+                partial(_encode, image, output),
+                iterations,
+            )
+        results.append(result)
+    return results
+
+
+def bench_geometry(
+    context: Context,
+    cover: Image.Image,
+    iterations: int,
+) -> List[BenchResult]:
+    """
+    Benchmark fused geometric processors of the configured layers.
+
+    Every chain of geometric processors from the render plan
+    is applied to the cover one by one and as a single transform.
+
+    :param context: mbg context with updated variables.
+    :param cover: decoded album cover.
+    :param iterations: number of runs.
+    :return: results for both ways of every chain.
+    """
+    screen = f"{context.screen.width}x{context.screen.height}"
+    plan = fuse_geometry(build_plan(context.layers, context.variables))
+    results = []
+    seen = set()
+    for _, node in plan.nodes():
+        if node.func is not transform or node.args in seen:
+            continue
+        seen.add(node.args)
+        steps = dict(node.args)["steps"]
+        for mode, func in (("sequential", apply_steps), ("fused", transform)):
+            name = f"geometry:{node.processor}:{mode}"
+            result = BenchResult(name=name, screen=screen)
+            with track_memory(result):
+                result.samples = measure(
+                    partial(_apply_geometry, func, cover, steps),
+                    iterations,
+                )
+            results.append(result)
+    return results
+
+
+def _apply_geometry(
+    func: Callable[[Image.Image, Any], Image.Image],
+    cover: Image.Image,
+    steps: Any,
+) -> None:
+    func(cover.copy(), steps)
+
+
+def run_bench(
+    context: Context,
+    sizes: List[Tuple[int, int]],
+    covers: List[Path],
+    *,
+    iterations: int = 5,
+    processors: bool = True,
+    pipeline: bool = True,
+) -> List[BenchResult]:
+    """
+    Run all benchmarks.
+
+    :param context: mbg context.
+    :param sizes: screen sizes to render at.
+    :param covers: sample covers. Synthetic cover is used if empty.
+    :param iterations: number of runs for every benchmark.
+    :param processors: benchmark every registered processor.
+    :param pipeline: benchmark configured pipeline.
+    :return: list of results.
+    """
+    encoded = [path.read_bytes() for path in covers] or [synthetic_cover()]
+    results: List[BenchResult] = []
+    for width, height in sizes:
+        context.screen = Screen(width=width, height=height)
+        for cover in encoded:
+            decoded = Image.open(BytesIO(cover)).convert("RGBA")
+            context.src_image = decoded.copy()
+            context.thumbnail = None
+            context.update_variables()
+            if processors:
+                results.extend(
+                    bench_processor(context, name, decoded, iterations)
+                    for name in sorted(context.processors_map)
+                )
+            if pipeline and context.config.layers:
+                results.extend(bench_pipeline(context, cover, iterations))
+                results.extend(bench_geometry(context, decoded, iterations))
+                rendered = process_image(decoded.copy(), context)
+                if rendered is not None:
+                    results.extend(bench_encoders(context, rendered, iterations))
+    return results
+
+
+def format_results(results: List[BenchResult], as_json: bool = False) -> str:
+    """
+    Format results as a table or JSON.
+
+    :param results: benchmark results.
+    :param as_json: format as JSON.
+    :return: formatted results.
+    """
+    if as_json:
+        return json.dumps(
+            {"results": [result.to_dict() for result in results]},
+            indent=2,
+        )
+    header = (
+        f"{'benchmark':<32}{'screen':>12}{'p50, ms':>12}{'p95, ms':>12}"
+        f"{'memory, MB':>12}"
+    )
+    lines = [header]
+    for result in results:
+        if result.skipped:
+            lines.append(f"{result.name:<32}{result.screen:>12}  {result.skipped}")
+            continue
+        memory = "-" if result.memory_mb is None else f"{result.memory_mb:.1f}"
+        lines.append(
+            f"{result.name:<32}{result.screen:>12}"
+            f"{result.p50 * 1000:>12.1f}{result.p95 * 1000:>12.1f}{memory:>12}",
+        )
+    return "\n".join(lines)
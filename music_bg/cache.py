@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from collections import ChainMap
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Self
+
+from loguru import logger
+from PIL.Image import Image
+
+from music_bg.config import CacheConfig
+from music_bg.utils import xdg_cache_home
+
+if TYPE_CHECKING:
+    from music_bg.context import Context, Screen
+
+
+def render_key(image: Image, context: Context, screen: Screen | None = None) -> str:
+    """
+    Compute a key of a wallpaper which would be rendered.
+
+    The key depends on decoded pixels of an album cover,
+    layers, blender and output configuration, screen size and values
+    of variables that are used in processor arguments.
+    The key ends with the extension of the output format.
+
+    :param image: decoded album cover.
+    :param context: current mbg context with updated variables.
+    :param screen: screen to render for, defaults to the biggest one.
+    :return: hex digest with file extension.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    hasher.update(image.tobytes())
+    pipeline = context.config.model_dump(include={"layers", "output"}, mode="json")
+    pipeline["blender"] = context.config.get_blender()
+    hasher.update(json.dumps(pipeline, sort_keys=True).encode())
+    screen = screen or context.screen
+    hasher.update(f"{screen.width}x{screen.height}".encode())
+    variables = ChainMap({"screen": screen}, context.variables)
+    for name in sorted(context.config.layers_variables()):
+        value = variables[name] if name in context.variables_providers else None
+        hasher.update(f"{name}={value!r}".encode())
+    return f"{hasher.hexdigest()}{context.config.output.suffix}"
+
+
+class DiskCache:
+    """
+    Bounded on-disk cache.
+
+    Least recently used entries are evicted
+    when cache exceeds entries count or total size.
+    Recency is tracked by modification time of cached files.
+    """
+
+    name = "cache"
+    suffix = ".bin"
+
+    def __init__(
+        self,
+        directory: Path,
+        max_entries: int,
+        max_size: int,
+        enabled: bool = True,
+    ) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: CacheConfig) -> Self:
+        """
+        Create cache in the user's cache directory.
+
+        :param config: cache configuration.
+        :return: new cache.
+        """
+        return cls(
+            directory=xdg_cache_home() / "music_bg" / cls.name,
+            max_entries=config.max_entries,
+            max_size=config.max_size_mb * 1024 * 1024,
+            enabled=config.enabled,
+        )
+
+    def configure(self, config: CacheConfig) -> None:
+        """
+        Apply new bounds to the cache.
+
+        Entries which don't fit new bounds are evicted.
+
+        :param config: cache configuration.
+        """
+        self.max_entries = config.max_entries
+        self.max_size = config.max_size_mb * 1024 * 1024
+        self.enabled = config.enabled
+        self.evict()
+
+    def path(self, key: str) -> Path:
+        """
+        Get path of the cache entry.
+
+        :param key: entry key.
+        :return: path to the entry's file.
+        """
+        return self.directory / f"{key}{self.suffix}"
+
+    def entries(self) -> List[Path]:
+        """
+        Get cached files.
+
+        :return: cached files from the least recently used.
+        """
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                # Evicted by another process.
+                continue
+            entries.append((mtime, path))
+        return [path for _, path in sorted(entries)]
+
+    def get(self, key: str) -> Path | None:
+        """
+        Find a cached file.
+
+        :param key: entry key.
+        :return: path to the file or None if it's not cached.
+        """
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        if not path.exists():
+            self.misses += 1
+            logger.debug(
+                f"Cache {self.name} miss ({self.hits} hits, {self.misses} misses)",
+            )
+            return None
+        self.hits += 1
+        logger.debug(f"Cache {self.name} hit ({self.hits} hits, {self.misses} misses)")
+        # Mark entry as recently used.
+        os.utime(path)
+        return path
+
+    def put(self, key: str, source: Path) -> None:
+        """
+        Copy file to the cache.
+
+        :param key: entry key.
+        :param source: path to the file.
+        """
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp_path = path.with_suffix(".tmp")
+        shutil.copyfile(source, tmp_path)
+        tmp_path.replace(path)
+        self.evict()
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        """
+        Write data to the cache.
+
+        :param key: entry key.
+        :param data: content of the entry.
+        """
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        self.evict()
+
+    def remove(self, path: Path) -> None:
+        """
+        Remove cache entry.
+
+        :param path: path to the entry's file.
+        """
+        path.unlink(missing_ok=True)
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits its bounds."""
+        entries = []
+        for path in self.entries():
+            try:
+                entries.append((path, path.stat().st_size))
+            except OSError:
+                continue
+        total_size = sum(size for _, size in entries)
+        while entries and (
+            len(entries) > self.max_entries or total_size > self.max_size
+        ):
+            path, size = entries.pop(0)
+            total_size -= size
+            self.remove(path)
+            logger.debug(f"Evicted {path.name} from {self.name} cache")
+
+    def clear(self) -> None:
+        """Remove all cached files."""
+        for path in self.entries():
+            self.remove(path)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get size and usage of the cache.
+
+        :return: entries count, total size in bytes, hits and misses.
+        """
+        entries = 0
+        size = 0
+        if self.directory.exists():
+            for path in self.directory.glob(f"*{self.suffix}"):
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    size += path.stat().st_size
+                except OSError:
+                    # Evicted by the rendering thread.
+                    continue
+                entries += 1
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RenderCache(DiskCache):
+    """
+    On-disk cache of rendered wallpapers.
+
+    Keys of wallpapers include extensions of
+    their formats, so entries have no common suffix.
+    """
+
+    name = "renders"
+    suffix = ""
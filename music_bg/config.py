@@ -1,10 +1,15 @@
 import enum
 import json
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, List, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
 
 import toml
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from music_bg.utils import template_variables
+
+# Variables of set_command with paths of per-monitor wallpapers.
+MONITOR_OUTPUT_VARIABLES = frozenset(("outs", "outputs"))
 
 
 class ImageProcessor(BaseModel):
@@ -29,6 +34,90 @@ class LogLevel(enum.Enum):
     DEBUG = "DEBUG"
 
 
+class CacheConfig(BaseModel):
+    """On-disk cache bounds."""
+
+    enabled: bool = True
+    max_entries: int = 100
+    max_size_mb: int = 500
+
+
+class OutputFormat(enum.Enum):
+    """Possible formats of rendered wallpaper."""
+
+    PNG = "png"
+    BMP = "bmp"
+    PPM = "ppm"
+    JPEG = "jpeg"
+    WEBP = "webp"
+
+
+class OutputConfig(BaseModel):
+    """Rendered wallpaper encoding."""
+
+    format: OutputFormat = OutputFormat.PNG
+    # zlib compression level of PNG, from 0 (none) to 9 (smallest).
+    compress_level: int = Field(default=1, ge=0, le=9)
+    # Quality of JPEG and WebP, from 1 to 100.
+    quality: int = Field(default=90, ge=1, le=100)
+
+    @property
+    def suffix(self) -> str:
+        """Extension of the output file."""
+        if self.format == OutputFormat.JPEG:
+            return ".jpg"
+        return f".{self.format.value}"
+
+
+class ProgressiveConfig(BaseModel):
+    """Two-pass rendering with a quick low resolution preview."""
+
+    enabled: bool = False
+    # Scale of the preview relative to the screen size.
+    scale: float = Field(default=0.25, gt=0, le=1)
+
+
+class PrefetchConfig(BaseModel):
+    """Prerendering of upcoming tracks from player's track list."""
+
+    enabled: bool = True
+    # Number of upcoming tracks to prerender.
+    tracks: int = Field(default=2, ge=0)
+    # Prerendering is paused while load average per CPU is higher.
+    max_load: float = 0.5
+    # Whether to prerender while running on battery.
+    on_battery: bool = False
+
+
+class MetricsConfig(BaseModel):
+    """Rendering timings export."""
+
+    # JSON file, or Prometheus textfile if it ends with ".prom".
+    path: Optional[Path] = None
+    # Number of last renders used to compute quantiles.
+    window: int = 100
+
+
+class PlayerPolicy(enum.Enum):
+    """How to choose a player to show when several are playing."""
+
+    # The player which started playing last.
+    RECENT = "recent"
+    # The first player from the priority list.
+    PRIORITY = "priority"
+
+
+class PlayersConfig(BaseModel):
+    """Handling of media players' signals."""
+
+    # Signals received within this window are handled at once.
+    debounce_ms: int = Field(default=150, ge=0)
+    policy: PlayerPolicy = PlayerPolicy.RECENT
+    # Player names, like "spotify" or "firefox", from the most important.
+    # Unlisted players follow the listed ones.
+    priority: list[str] = []
+
+
 class Config(BaseModel):
     """User configuration object."""
 
@@ -38,8 +127,65 @@ class Config(BaseModel):
     set_command: str = 'feh --bg-fill "{out}"'
     reset_command: str = "nitrogen --restore"
 
+    # Merge chained fit and resize processors into a single resampling.
+    fuse_geometry: bool = True
+
+    # Number of layer workers. Defaults to the number of CPUs.
+    # With 0 layers are processed in the main process.
+    workers: Optional[int] = Field(default=None, ge=0)
+
+    render_cache: CacheConfig = CacheConfig()
+    art_cache: CacheConfig = CacheConfig(max_entries=500, max_size_mb=200)
+    output: OutputConfig = OutputConfig()
+    prefetch: PrefetchConfig = PrefetchConfig()
+    progressive: ProgressiveConfig = ProgressiveConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    players: PlayersConfig = PlayersConfig()
+
     layers: list[Layer] = []
 
+    def get_blender(self) -> list[Union[str, int]]:
+        """
+        Get order in which layers are blended.
+
+        If blender is not set, layers are blended
+        in the order they are defined.
+
+        :return: list of layer names.
+        """
+        if self.blender:
+            return self.blender
+        return [layer.name for layer in self.layers]
+
+    def layers_variables(self) -> Set[str]:
+        """
+        Find variables used in arguments of layer processors.
+
+        :return: set of top-level variable names.
+        """
+        names: Set[str] = set()
+        for layer in self.layers:
+            for processor in layer.processors:
+                for arg_value in (processor.args or {}).values():
+                    names.update(template_variables(str(arg_value)))
+        return names
+
+    def uses_monitor_outputs(self) -> bool:
+        """
+        Check whether set_command uses wallpapers of every monitor.
+
+        :return: True if per-monitor output variables are used.
+        """
+        return bool(MONITOR_OUTPUT_VARIABLES & template_variables(self.set_command))
+
+    def referenced_variables(self) -> Set[str]:
+        """
+        Find variables used anywhere in the config.
+
+        :return: set of top-level variable names.
+        """
+        return self.layers_variables() | template_variables(self.set_command)
+
     @classmethod
     def get_serde_by_extension(
         cls,
@@ -2,14 +2,20 @@ from __future__ import annotations
 
 from importlib.metadata import entry_points
 from pathlib import Path
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Set
 
 import screeninfo
 from loguru import logger
 from PIL.Image import Image
 from pydantic import BaseModel, Field
 
+from music_bg.cache import RenderCache
 from music_bg.config import Config
+from music_bg.dbus.art import ArtFetcher
+from music_bg.img_processors.compiler import CompiledLayer, compile_layers
+from music_bg.metrics import Metrics
+from music_bg.pool import LayerPool
+from music_bg.utils import log_duration
 
 
 class Metadata(BaseModel):
@@ -31,6 +37,45 @@ class Screen(BaseModel):
     height: int = 768
 
 
+class Monitor(Screen):
+    """Connected monitor."""
+
+    name: str = ""
+
+
+class Variables(Dict[str, Any]):
+    """
+    Variables mapping.
+
+    Variables that weren't computed yet
+    are computed by their providers on the first access.
+    """
+
+    def __init__(self, context: Context) -> None:
+        super().__init__()
+        self.context = context
+
+    def __missing__(self, name: str) -> Any:
+        return self.evaluate(name)
+
+    def evaluate(self, name: str) -> Any:
+        """
+        Compute value of a variable with its provider.
+
+        :param name: name of a variable.
+        :raises KeyError: if variable provider is not found.
+        :return: value of a variable.
+        """
+        provider = self.context.variables_providers.get(name)
+        if provider is None:
+            raise KeyError(name)
+        with self.context.metrics.span(f"variable:{name}"):
+            value = provider(self.context)
+        logger.debug(f"VAR '{name}' = {value}")
+        self[name] = value
+        return value
+
+
 class Context:
     """music_bg context object."""
 
@@ -50,18 +95,39 @@ class Context:
         """
         self.config_path = config_path or Path("~/.mbg.json")
         self.config = Config()
+        self.config_mtime: int | None = None
+        # Set by SIGHUP, the reload itself is done by `refresh`.
+        self.reload_requested = False
+        self.used_variables: Set[str] = set()
+        self.layers: List[CompiledLayer] = []
         self.last_status = ""
         self.screen = Screen()
+        self.monitors: List[Monitor] = []
         self.metadata = Metadata()
+        # Album cover, the input of variables providers.
         self.src_image: Image | None = None
+        # Small version of the cover colors are extracted from.
+        self.thumbnail: Image | None = None
         self.previous_image: Image | None = None
         self.processors_map: Dict[str, Callable[..., Image]] = {}
-        self.variables: Dict[str, Any] = {}
+        self.variables = Variables(self)
         self.variables_providers: Dict[str, Callable[..., Any]] = {
             "screen": Context.get_screen,
             "metadata": Context.get_metadata,
         }
         self.reload()
+        self.pool = LayerPool(self.config.workers)
+        self.render_cache = RenderCache.from_config(self.config.render_cache)
+        self.art_fetcher = ArtFetcher.from_config(self.config.art_cache)
+        self.metrics = Metrics(self.config.metrics.window)
+        self.log_timings = False
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Worker pool and HTTP session can't be sent to another process.
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["art_fetcher"] = None
+        return state
 
     def get_screen(self) -> Screen:
         """Get screen var provider."""
@@ -69,26 +135,109 @@ class Context:
 
     def reload(self) -> None:
         """Perform full context reload."""
-        self.reload_config()
-        self.reload_processors()
-        self.reload_screen_size()
-        self.reload_variables_providers()
+        with log_duration("Processors discovery"):
+            self.reload_processors()
+        with log_duration("Variables providers discovery"):
+            self.reload_variables_providers()
+        with log_duration("Config reload"):
+            self.reload_config()
+        with log_duration("Screen size update"):
+            self.reload_screen_size()
+
+    def refresh(self) -> None:
+        """
+        Reload configuration if it was changed or a reload was requested.
+
+        Changes are detected by modification time
+        of the configuration file. Requested reloads
+        update the screen size too. Reloaded settings
+        are applied to the pool, caches and metrics.
+
+        It's called by the renderer before every render,
+        so the context is never changed while it's in use.
+        """
+        requested = self.reload_requested
+        self.reload_requested = False
+        if requested:
+            logger.info("Reloading config and screen size")
+            with log_duration("Screen size update"):
+                self.reload_screen_size()
+        try:
+            mtime = self.config_path.expanduser().stat().st_mtime_ns
+        except OSError as exc:
+            logger.warning(f"Can't check config file: {exc}")
+            return
+        if mtime == self.config_mtime and not requested:
+            return
+        if not requested:
+            logger.info("Config file was changed")
+        previous = self.config
+        with log_duration("Config reload"):
+            try:
+                self.reload_config()
+            except (OSError, ValueError) as exc:
+                logger.error(f"Can't reload config, keeping the previous one: {exc}")
+                return
+        self.apply_settings(previous)
+
+    def apply_settings(self, previous: Config) -> None:
+        """
+        Apply reloaded settings of the pool, caches and metrics.
+
+        They're created once at startup, so their settings
+        are updated in place, only the pool is restarted.
+
+        :param previous: config they were created with.
+        """
+        config = self.config
+        if config.workers != previous.workers:
+            logger.info("Restarting layer workers")
+            self.pool.close()
+            self.pool = LayerPool(config.workers)
+        self.render_cache.configure(config.render_cache)
+        self.art_fetcher.cache.configure(config.art_cache)
+        if config.metrics.window != previous.metrics.window:
+            self.metrics.resize(config.metrics.window)
 
     def reload_config(self) -> None:
-        """Update configuration from file."""
-        self.config = Config.from_file(self.config_path.expanduser())
+        """
+        Update configuration from file.
+
+        Layers are compiled right away, so errors in
+        processors and their arguments are reported on load.
+
+        :raises ValueError: if config is invalid.
+        """
+        config_path = self.config_path.expanduser()
+        self.config_mtime = config_path.stat().st_mtime_ns
+        config = Config.from_file(config_path)
+        self.layers = compile_layers(
+            config.layers,
+            self.processors_map,
+            self.variables_providers,
+        )
+        self.config = config
+        self.used_variables = self.config.referenced_variables()
 
     def reload_screen_size(self) -> None:
         """
-        Update biggest screen size.
+        Update connected monitors and the biggest screen size.
 
         :raises ValueError: if can't get screen size or format is invalid.
         """
         logger.debug("Updating screen resolution")
+        self.monitors = [
+            Monitor(
+                name=monitor.name or str(index),
+                width=monitor.width,
+                height=monitor.height,
+            )
+            for index, monitor in enumerate(screeninfo.get_monitors())
+        ]
         # Sort screens by their areas
         # and get the last one.
         biggest_screen = sorted(
-            screeninfo.get_monitors(),
+            self.monitors,
             key=lambda m: m.width * m.height,
         )[-1]
 
@@ -97,6 +246,26 @@ class Context:
             height=biggest_screen.height,
         )
 
+    def render_screens(self) -> List[Screen]:
+        """
+        Get screen sizes wallpaper should be rendered for.
+
+        If set_command uses per-monitor outputs,
+        wallpaper is rendered once for every distinct resolution
+        of connected monitors. Otherwise only the biggest screen
+        is rendered.
+
+        :return: screen sizes, the biggest one goes first.
+        """
+        if not self.config.uses_monitor_outputs():
+            return [self.screen]
+        sizes = {(monitor.width, monitor.height) for monitor in self.monitors}
+        sizes.discard((self.screen.width, self.screen.height))
+        return [self.screen] + [
+            Screen(width=width, height=height)
+            for width, height in sorted(sizes, key=lambda size: -size[0] * size[1])
+        ]
+
     def reload_processors(self) -> None:
         """Find and load in memory all image processors."""
         for entrypoint in entry_points(group="mbg_processors"):
@@ -146,14 +315,18 @@ class Context:
         """
         return self.metadata
 
-    def update_variables(self) -> None:
+    def update_variables(self, force: bool = False) -> None:
         """
-        Get variables mapping.
+        Update variables mapping.
+
+        Only variables used in the config are computed,
+        other ones are computed on the first access.
 
-        :return: mapping with variables.
+        :param force: compute all available variables.
         """
         self.variables.clear()
-        for name, var_func in self.variables_providers.items():
-            value = var_func(self)
-            logger.debug(f"VAR '{name}' = {value}")
-            self.variables[name] = value
+        names = set(self.variables_providers)
+        if not force:
+            names &= self.used_variables
+        for name in names:
+            self.variables.evaluate(name)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+from loguru import logger
+
+from music_bg.cache import DiskCache
+from music_bg.config import CacheConfig
+
+
+class ArtCache(DiskCache):
+    """
+    On-disk cache of downloaded album covers.
+
+    Each entry has a sidecar JSON file with
+    validators to revalidate it with a server.
+    """
+
+    name = "art"
+    suffix = ".img"
+
+    def meta_path(self, key: str) -> Path:
+        """
+        Get path to entry's validators.
+
+        :param key: entry key.
+        :return: path to JSON file.
+        """
+        return self.directory / f"{key}.json"
+
+    def get_meta(self, key: str) -> Dict[str, str]:
+        """
+        Read validators of an entry.
+
+        :param key: entry key.
+        :return: ETag and Last-Modified headers of a cached response.
+        """
+        try:
+            return json.loads(self.meta_path(key).read_text())  # type: ignore
+        except (OSError, ValueError):
+            return {}
+
+    def put_response(self, key: str, response: requests.Response) -> None:
+        """
+        Cache response body along with its validators.
+
+        :param key: entry key.
+        :param response: successful response.
+        """
+        if not self.enabled:
+            return
+        meta = {
+            header: response.headers[header]
+            for header in ("ETag", "Last-Modified")
+            if header in response.headers
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.meta_path(key).write_text(json.dumps(meta))
+        self.put_bytes(key, response.content)
+
+    def remove(self, path: Path) -> None:
+        """
+        Remove cached cover and its validators.
+
+        :param path: path to the cached cover.
+        """
+        super().remove(path)
+        path.with_suffix(".json").unlink(missing_ok=True)
+
+
+class ArtFetcher:
+    """
+    Album covers downloader.
+
+    It keeps connections to servers alive between tracks
+    and revalidates cached covers with conditional requests.
+    """
+
+    def __init__(self, cache: ArtCache, timeout: float = 5) -> None:
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: CacheConfig) -> ArtFetcher:
+        """
+        Create fetcher with cache in the user's cache directory.
+
+        :param config: art cache configuration.
+        :return: new fetcher.
+        """
+        return cls(ArtCache.from_config(config))
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """
+        Get album cover.
+
+        :param url: cover URL.
+        :return: raw cover bytes or None if it can't be downloaded.
+        """
+        start = time.perf_counter()
+        key = hashlib.sha256(url.encode()).hexdigest()
+        headers = {}
+        cached = self.cache.enabled and self.cache.path(key).exists()
+        if cached:
+            meta = self.cache.get_meta(key)
+            if "ETag" in meta:
+                headers["If-None-Match"] = meta["ETag"]
+            if "Last-Modified" in meta:
+                headers["If-Modified-Since"] = meta["Last-Modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as exc:
+            logger.warning(f"Can't download {url}: {exc}")
+            if not cached:
+                return None
+            return self._hit(key, "served offline", start)
+        if response.status_code == requests.codes.not_modified and cached:
+            return self._hit(key, "revalidated", start)
+        if not response.ok:
+            logger.debug(f"Image response returned status {response.status_code}")
+            return None
+        self.misses += 1
+        self.cache.put_response(key, response)
+        logger.debug(
+            f"Art downloaded in {time.perf_counter() - start:.3f}s "
+            f"({self.hits} hits, {self.misses} misses)",
+        )
+        return response.content
+
+    def _hit(self, key: str, reason: str, start: float) -> Optional[bytes]:
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        self.hits += 1
+        logger.debug(
+            f"Art {reason} from cache in {time.perf_counter() - start:.3f}s "
+            f"({self.hits} hits, {self.misses} misses)",
+        )
+        return cached.read_bytes()
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.session.close()
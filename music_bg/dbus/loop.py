@@ -1,10 +1,20 @@
+import signal
+
 import dbus
 from dbus.mainloop.glib import DBusGMainLoop
 from gi.repository import GLib
 from loguru import logger
 
 from music_bg.context import Context
-from music_bg.dbus.handlers import player_exit_handler, player_signal_handler
+from music_bg.dbus.handlers import (
+    player_exit_handler,
+    player_signal_handler,
+    reload_signal_handler,
+)
+from music_bg.dbus.players import PlayerTracker
+from music_bg.dbus.service import DaemonService
+from music_bg.dbus.tracklist import TrackListPrefetcher
+from music_bg.renderer import Renderer
 
 
 def run_loop(context: Context) -> None:
@@ -16,19 +26,36 @@ def run_loop(context: Context) -> None:
     logger.info("Setting up dbus connection.")
     dbus_loop = DBusGMainLoop()
     bus = dbus.SessionBus(mainloop=dbus_loop)
+    renderer = Renderer(context)
+    prefetcher = TrackListPrefetcher(context, renderer, bus)
+    tracker = PlayerTracker(context, renderer, GLib.timeout_add, prefetcher)
     bus.add_signal_receiver(
-        player_signal_handler(context),
+        player_signal_handler(tracker),
         dbus_interface="org.freedesktop.DBus.Properties",
         path="/org/mpris/MediaPlayer2",
         interface_keyword="dbus_interface",
+        sender_keyword="sender",
         arg0="org.mpris.MediaPlayer2.Player",
     )
+    for name in bus.list_names():
+        if str(name).startswith("org.mpris.MediaPlayer2."):
+            tracker.player_appeared(str(name), str(bus.get_name_owner(name)))
     bus.add_signal_receiver(
-        player_exit_handler(context),
+        player_exit_handler(tracker),
         dbus_interface="org.freedesktop.DBus",
         signal_name="NameOwnerChanged",
         interface_keyword="dbus_interface",
     )
+    DaemonService(bus, context, renderer, tracker)
+    GLib.unix_signal_add(
+        GLib.PRIORITY_DEFAULT,
+        signal.SIGHUP,
+        reload_signal_handler(context),
+    )
     logger.info("Loop is ready.")
     loop = GLib.MainLoop()
-    loop.run()
+    renderer.start()
+    try:
+        loop.run()
+    finally:
+        renderer.stop()
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import ValidationError
+
+from music_bg.config import PlayerPolicy
+from music_bg.context import Context, Metadata
+from music_bg.dbus.tracklist import TrackListPrefetcher
+from music_bg.renderer import Renderer
+
+MPRIS_PREFIX = "org.mpris.MediaPlayer2."
+NO_TRACK = "/org/mpris/MediaPlayer2/TrackList/NoTrack"
+
+# Properties which can change the background.
+RELEVANT_PROPERTIES = frozenset(("PlaybackStatus", "Metadata"))
+
+# Background state: wallpaper of a track or None for reset.
+Effect = Optional[Tuple[Any, ...]]
+
+
+@dataclass
+class PlayerState:
+    """Last known state of a player."""
+
+    status: str = ""
+    metadata: Optional[Metadata] = None
+    # Order in which players started playing.
+    started: int = 0
+    # Metadata received during current debounce window.
+    raw_metadata: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+    @property
+    def playing(self) -> bool:
+        """Whether the player is playing."""
+        return self.status == "playing"
+
+
+def priority_index(name: Optional[str], priority: List[str]) -> int:
+    """
+    Find position of a player in the priority list.
+
+    "firefox" matches both "org.mpris.MediaPlayer2.firefox"
+    and "org.mpris.MediaPlayer2.firefox.instance_1_23".
+
+    :param name: well-known bus name of the player.
+    :param priority: player names from the most important.
+    :return: position in the list or its length for unlisted players.
+    """
+    short_name = (name or "").removeprefix(MPRIS_PREFIX).lower()
+    for index, entry in enumerate(priority):
+        lowered = entry.lower()
+        if short_name == lowered or short_name.startswith(f"{lowered}."):
+            return index
+    return len(priority)
+
+
+class PlayerTracker:
+    """
+    State machine of media players.
+
+    PropertiesChanged signals only update state of the player
+    that sent them. Signals are collapsed within a debounce window
+    and then a player to show is chosen among playing ones
+    according to the configured policy. The background is updated
+    only if the effective state has changed since the last update.
+    """
+
+    def __init__(
+        self,
+        context: Context,
+        renderer: Renderer,
+        schedule: Callable[[int, Callable[[], bool]], Any],
+        prefetcher: Optional[TrackListPrefetcher] = None,
+    ) -> None:
+        """
+        Create player tracker.
+
+        :param context: current mbg context.
+        :param renderer: background renderer.
+        :param schedule: function that calls a callback after
+            given number of milliseconds, like GLib.timeout_add.
+        :param prefetcher: reader of upcoming tracks.
+        """
+        self.context = context
+        self.renderer = renderer
+        self.schedule = schedule
+        self.prefetcher = prefetcher
+        # States of players by their unique bus names.
+        self.players: Dict[str, PlayerState] = {}
+        # Well-known names of players by their unique bus names.
+        self.names: Dict[str, str] = {}
+        # Player which is shown now.
+        self.active: Optional[str] = None
+        self.applied: Effect = None
+        self.flush_scheduled = False
+        self.signals = 0
+        self.renders = 0
+        self.resets = 0
+        self._order = itertools.count(1)
+
+    def properties_changed(self, sender: str, changed: Dict[str, Any]) -> None:
+        """
+        Update state of a player.
+
+        :param sender: unique bus name of the player.
+        :param changed: changed properties.
+        """
+        self.signals += 1
+        if not RELEVANT_PROPERTIES.intersection(changed):
+            return
+        state = self.players.setdefault(sender, PlayerState())
+        if "PlaybackStatus" in changed:
+            was_playing = state.playing
+            state.status = str(changed["PlaybackStatus"]).lower()
+            if state.playing and not was_playing:
+                state.started = next(self._order)
+        if "Metadata" in changed:
+            state.raw_metadata = changed["Metadata"]
+        self._schedule_flush()
+
+    def player_appeared(self, name: str, sender: str) -> None:
+        """
+        Remember well-known name of a player.
+
+        :param name: well-known bus name, like "org.mpris.MediaPlayer2.vlc".
+        :param sender: unique bus name of the player.
+        """
+        self.names[sender] = name
+
+    def player_exited(self, sender: str) -> None:
+        """
+        Forget a player and show the next active one.
+
+        :param sender: unique bus name of the player.
+        """
+        self.names.pop(sender, None)
+        if self.players.pop(sender, None) is not None:
+            self._schedule_flush()
+
+    def choose(self) -> Optional[str]:
+        """
+        Choose a player to show.
+
+        Only playing players with known tracks are considered.
+
+        :return: unique bus name of the player or None.
+        """
+        candidates = [
+            sender
+            for sender, state in self.players.items()
+            if state.playing and state.metadata is not None
+        ]
+        if not candidates:
+            return None
+        config = self.context.config.players
+        if config.policy == PlayerPolicy.PRIORITY:
+            return min(
+                candidates,
+                key=lambda sender: (
+                    priority_index(self.names.get(sender), config.priority),
+                    -self.players[sender].started,
+                ),
+            )
+        return max(candidates, key=lambda sender: self.players[sender].started)
+
+    def flush(self) -> bool:
+        """
+        Update background after debounce window.
+
+        :return: False, so the timeout isn't repeated.
+        """
+        self.flush_scheduled = False
+        for state in self.players.values():
+            self._parse_metadata(state)
+        active = self.choose()
+        if active != self.active:
+            logger.debug(f"Active player: {self.names.get(active or '', active)}")
+            self.active = active
+        self.apply(active, self.players[active] if active else None)
+        return False
+
+    def effect(self, state: PlayerState) -> Effect:
+        """
+        Compute background state for a playing player.
+
+        Tracks with the same cover have the same
+        background, unless metadata is used in the config.
+
+        :param state: state of the player.
+        :return: key of the background.
+        """
+        metadata = state.metadata or Metadata()
+        if "metadata" in self.context.used_variables:
+            return (metadata.art_url, metadata.model_dump_json())
+        return (metadata.art_url,)
+
+    def apply(self, sender: Optional[str], state: Optional[PlayerState]) -> None:
+        """
+        Request background update if the effective state has changed.
+
+        Wallpapers of tracks shown before are taken
+        from the render cache, so switching back
+        to another player is cheap.
+
+        :param sender: unique bus name of the player to show.
+        :param state: state of the player or None to reset background.
+        """
+        effect = None if state is None else self.effect(state)
+        if effect == self.applied:
+            logger.debug(
+                f"Background is up to date ({self.signals} signals, "
+                f"{self.renders} renders, {self.resets} resets)",
+            )
+            return
+        self.applied = effect
+        if state is None or state.metadata is None:
+            self.context.last_status = "stopped"
+            self.resets += 1
+            logger.info("Resetting background")
+            self.renderer.submit(None)
+            return
+        self.context.last_status = state.status
+        self.context.metadata = state.metadata
+        self.renders += 1
+        logger.info(f"Rendering {state.metadata.art_url}")
+        self.renderer.submit(state.metadata)
+        if self.prefetcher is not None:
+            self.prefetcher.refresh(sender, state.metadata.track_id)
+
+    def rerender(self) -> None:
+        """Request update of the background even if it's up to date."""
+        self.applied = ()
+        active = self.players.get(self.active or "")
+        self.apply(self.active, active)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Get state of players.
+
+        :return: active player, known players and signal counters.
+        """
+        active = self.players.get(self.active or "")
+        return {
+            "active": self.names.get(self.active or "", self.active),
+            "track": active.metadata.art_url if active and active.metadata else None,
+            "players": {
+                self.names.get(sender, sender): state.status
+                for sender, state in self.players.items()
+            },
+            "signals": self.signals,
+            "renders": self.renders,
+            "resets": self.resets,
+        }
+
+    def _schedule_flush(self) -> None:
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.schedule(self.context.config.players.debounce_ms, self.flush)
+
+    def _parse_metadata(self, state: PlayerState) -> None:
+        raw_meta = state.raw_metadata
+        if raw_meta is None:
+            return
+        state.raw_metadata = None
+        try:
+            metadata = Metadata(**raw_meta)
+        except ValidationError as exc:
+            logger.debug(f"Can't parse metadata: {exc}")
+            return
+        if metadata.track_id == NO_TRACK:
+            state.metadata = None
+            return
+        if metadata.art_url is None:
+            logger.debug("Can't get art_url")
+            return
+        state.metadata = metadata
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict
+
+import dbus
+import dbus.service
+from loguru import logger
+
+from music_bg.context import Context
+from music_bg.dbus.players import PlayerTracker
+from music_bg.renderer import Renderer
+
+BUS_NAME = "org.musicbg.Daemon"
+OBJECT_PATH = "/org/musicbg/Daemon"
+INTERFACE = "org.musicbg.Daemon"
+
+
+def collect_status(
+    context: Context,
+    renderer: Renderer,
+    tracker: PlayerTracker,
+) -> Dict[str, Any]:
+    """
+    Gather state of the daemon.
+
+    :param context: current mbg context.
+    :param renderer: background renderer.
+    :param tracker: state machine of players.
+    :return: JSON-serializable status.
+    """
+    stages = dict(context.metrics.last)
+    art_cache = context.art_fetcher.cache.stats()
+    # Revalidated and offline covers are counted by the fetcher.
+    art_lookups = context.art_fetcher.hits + context.art_fetcher.misses
+    art_cache.update(
+        hits=context.art_fetcher.hits,
+        misses=context.art_fetcher.misses,
+        hit_rate=context.art_fetcher.hits / art_lookups if art_lookups else 0.0,
+    )
+    return {
+        "render": {
+            "last": stages.get("render"),
+            "stages": stages,
+        },
+        "caches": {
+            "renders": context.render_cache.stats(),
+            "art": art_cache,
+        },
+        "pool": {
+            "started": context.pool.started,
+            "workers": context.pool.processes,
+        },
+        "queue": renderer.status(),
+        "players": tracker.status(),
+    }
+
+
+def format_status(status: Dict[str, Any]) -> str:
+    """
+    Format daemon status as human-readable text.
+
+    :param status: status returned by the daemon.
+    :return: text with a line per value.
+    """
+    lines = []
+    players = status["players"]
+    lines.append(f"active player: {players['active'] or '-'}")
+    lines.append(f"track: {players['track'] or '-'}")
+    lines.append(
+        f"signals: {players['signals']}, renders: {players['renders']}, "
+        f"resets: {players['resets']}",
+    )
+    queue = status["queue"]
+    for name in ("in_flight", "pending"):
+        request = queue[name]
+        if request is None:
+            description = "-"
+        elif request["flush"]:
+            description = "flush"
+        elif request["reset"]:
+            description = "reset"
+        else:
+            kind = "prerender" if request["prefetch"] else "render"
+            description = f"{kind} {request['track']}"
+        lines.append(f"{name.replace('_', '-')}: {description}")
+    lines.append(f"prerender queue: {len(queue['prefetch_queue'])}")
+    pool = status["pool"]
+    pool_state = "started" if pool["started"] else "stopped"
+    workers = "auto" if pool["workers"] is None else pool["workers"]
+    lines.append(f"pool: {pool_state}, {workers} workers")
+    for name, cache in status["caches"].items():
+        state = "" if cache["enabled"] else " (disabled)"
+        lines.append(
+            f"{name} cache{state}: {cache['entries']} entries, "
+            f"{cache['size'] / 1024 / 1024:.1f} MB, "
+            f"hit rate {cache['hit_rate']:.0%} "
+            f"({cache['hits']} hits, {cache['misses']} misses)",
+        )
+    render = status["render"]
+    if render["last"] is not None:
+        lines.append(f"last render: {render['last'] * 1000:.1f}ms")
+    for stage, duration in sorted(render["stages"].items()):
+        lines.append(f"    {stage}: {duration * 1000:.1f}ms")
+    return "\n".join(lines)
+
+
+def get_status(bus: Any) -> Dict[str, Any]:
+    """
+    Request status of a running daemon.
+
+    :param bus: D-Bus connection the daemon is on.
+    :return: daemon status.
+    """
+    daemon = bus.get_object(BUS_NAME, OBJECT_PATH)
+    status: Dict[str, Any] = json.loads(daemon.GetStatus(dbus_interface=INTERFACE))
+    return status
+
+
+class DaemonService(dbus.service.Object):
+    """
+    D-Bus object with the state of the daemon.
+
+    It's exported as `org.musicbg.Daemon` on the session bus.
+    All methods run in the D-Bus loop and never wait for renders.
+    """
+
+    def __init__(
+        self,
+        bus: Any,
+        context: Context,
+        renderer: Renderer,
+        tracker: PlayerTracker,
+    ) -> None:
+        self.context = context
+        self.renderer = renderer
+        self.tracker = tracker
+        self.bus_name = dbus.service.BusName(BUS_NAME, bus)
+        super().__init__(self.bus_name, OBJECT_PATH)
+
+    @dbus.service.method(INTERFACE, in_signature="", out_signature="s")
+    def GetStatus(self) -> str:  # noqa: N802
+        """
+        Get state of the daemon.
+
+        :return: status as JSON.
+        """
+        return json.dumps(collect_status(self.context, self.renderer, self.tracker))
+
+    @dbus.service.method(INTERFACE, in_signature="", out_signature="")
+    def Rerender(self) -> None:  # noqa: N802
+        """Render and set the background of the current track again."""
+        logger.info("Rerender requested")
+        self.tracker.rerender()
+
+    @dbus.service.method(INTERFACE, in_signature="", out_signature="")
+    def Flush(self) -> None:  # noqa: N802
+        """Drop prerendered tracks and cached wallpapers, export metrics."""
+        logger.info("Flush requested")
+        self.renderer.flush()
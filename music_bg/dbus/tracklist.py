@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from loguru import logger
+from pydantic import ValidationError
+
+from music_bg.context import Context, Metadata
+from music_bg.renderer import Renderer
+
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+TRACKLIST_INTERFACE = "org.mpris.MediaPlayer2.TrackList"
+
+
+def upcoming_track_ids(
+    track_ids: Sequence[str],
+    current_id: Optional[str],
+    count: int,
+) -> List[str]:
+    """
+    Find tracks that follow the current one.
+
+    :param track_ids: tracks of the track list.
+    :param current_id: id of the current track.
+    :param count: max number of tracks.
+    :return: ids of upcoming tracks.
+    """
+    ids = [str(track_id) for track_id in track_ids]
+    if current_id not in ids:
+        return []
+    start = ids.index(str(current_id)) + 1
+    return ids[start : start + count]
+
+
+def parse_tracks(tracks_metadata: Sequence[Dict[str, Any]]) -> List[Metadata]:
+    """
+    Build metadata of tracks with album covers.
+
+    :param tracks_metadata: metadata from the track list.
+    :return: tracks which have art url.
+    """
+    tracks = []
+    for raw_meta in tracks_metadata:
+        try:
+            metadata = Metadata(**raw_meta)
+        except ValidationError as exc:
+            logger.debug(f"Can't parse track metadata: {exc}")
+            continue
+        if metadata.art_url:
+            tracks.append(metadata)
+    return tracks
+
+
+class TrackListPrefetcher:
+    """
+    Reader of players' track lists.
+
+    When a track changes, upcoming tracks are requested
+    from the player with `org.mpris.MediaPlayer2.TrackList`
+    interface and passed to the renderer for prerendering.
+
+    All D-Bus calls are asynchronous, so the loop is never blocked.
+    Any object with dbus-python's `get_object` method
+    can be used as a bus.
+    """
+
+    def __init__(self, context: Context, renderer: Renderer, bus: Any) -> None:
+        self.context = context
+        self.renderer = renderer
+        self.bus = bus
+
+    def refresh(self, sender: Optional[str], track_id: Optional[str]) -> None:
+        """
+        Request upcoming tracks of a player.
+
+        :param sender: bus name of the player.
+        :param track_id: id of the current track.
+        """
+        config = self.context.config.prefetch
+        if not config.enabled or not config.tracks or not sender or not track_id:
+            return
+        player = self.bus.get_object(sender, MPRIS_PATH)
+        player.Get(
+            TRACKLIST_INTERFACE,
+            "Tracks",
+            dbus_interface=PROPERTIES_INTERFACE,
+            reply_handler=lambda track_ids: self._on_tracks(
+                player,
+                track_ids,
+                track_id,
+            ),
+            error_handler=self._on_error,
+        )
+
+    def _on_tracks(
+        self,
+        player: Any,
+        track_ids: Sequence[str],
+        current_id: str,
+    ) -> None:
+        upcoming = upcoming_track_ids(
+            track_ids,
+            current_id,
+            self.context.config.prefetch.tracks,
+        )
+        if not upcoming:
+            return
+        player.GetTracksMetadata(
+            upcoming,
+            dbus_interface=TRACKLIST_INTERFACE,
+            reply_handler=self._on_metadata,
+            error_handler=self._on_error,
+        )
+
+    def _on_metadata(self, tracks_metadata: Sequence[Dict[str, Any]]) -> None:
+        tracks = parse_tracks(tracks_metadata)
+        logger.debug(f"Queued {len(tracks)} upcoming tracks for prerendering")
+        self.renderer.prefetch(tracks)
+
+    def _on_error(self, error: Exception) -> None:
+        # Most of players don't implement TrackList interface.
+        logger.debug(f"Can't get upcoming tracks: {error}")
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import math
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from PIL import Image
+
+from music_bg.context import Context, Screen
+from music_bg.img_processors.blank_img import blank_image
+from music_bg.img_processors.geometry import node_steps, source_scale
+from music_bg.img_processors.gradients import radial_gradient
+from music_bg.img_processors.load_img import load_img
+from music_bg.img_processors.plan import PlanNode
+from music_bg.img_processors.processor import build_plans
+from music_bg.img_variables.colors import colors_var
+from music_bg.img_variables.uuid_gen import uuid4
+from music_bg.palette import THUMBNAIL_SIZE
+
+Size = Tuple[int, int]
+
+# Processors which don't use pixels of the input image.
+# Predicates tell whether its size isn't used either.
+_GENERATORS: Dict[Callable[..., Image.Image], Callable[[Dict[str, Any]], bool]] = {
+    blank_image: lambda _args: True,
+    load_img: lambda _args: True,
+    radial_gradient: lambda args: bool(args.get("width") and args.get("height")),
+}
+
+# Variables providers which don't read `Context.src_image`.
+_THUMBNAIL_PROVIDERS = frozenset(
+    (Context.get_screen, Context.get_metadata, uuid4, colors_var),
+)
+
+
+def decode_image(data: bytes, size: Optional[Size] = None) -> Image.Image:
+    """
+    Decode an image, at a reduced scale if possible.
+
+    JPEG decoder can scale images down by 1/2, 1/4 or 1/8
+    while decoding, the smallest scale which is at least
+    the requested size is used. Other formats are
+    always decoded at full size.
+
+    :param data: encoded image.
+    :param size: minimal width and height of the result,
+        defaults to the full size.
+    :return: RGBA image.
+    """
+    with Image.open(BytesIO(data)) as image:
+        if size is not None and (size[0] < image.width or size[1] < image.height):
+            image.draft(None, size)
+        return image.convert("RGBA")
+
+
+def decode_thumbnail(data: bytes) -> Image.Image:
+    """
+    Decode a small version of an album cover for color extraction.
+
+    :param data: encoded album cover.
+    :return: RGBA image, which is at least THUMBNAIL_SIZE if the cover is.
+    """
+    return decode_image(data, (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+
+def decode_full(data: bytes, thumbnail: Optional[Image.Image] = None) -> Image.Image:
+    """
+    Decode an album cover at full size.
+
+    :param data: encoded album cover.
+    :param thumbnail: cover decoded by `decode_thumbnail`,
+        it's reused if it was decoded at full size.
+    :return: RGBA image.
+    """
+    if thumbnail is not None:
+        with Image.open(BytesIO(data)) as header:
+            if header.size == thumbnail.size:
+                return thumbnail.copy()
+    return decode_image(data)
+
+
+def reads_cover(context: Context) -> bool:
+    """
+    Check whether variables used in the config may read the cover.
+
+    Built-in variables are computed from `Context.thumbnail`,
+    but other providers get `Context.src_image` and may
+    read its pixels or size. The cover is decoded at full size
+    for them before variables are computed, otherwise it's decoded
+    by `decode_cover` at the scale the layers need.
+
+    :param context: current mbg context.
+    :return: True if the cover must be decoded before variables.
+    """
+    return any(
+        context.variables_providers[name] not in _THUMBNAIL_PROVIDERS
+        for name in context.used_variables
+        if name in context.variables_providers
+    )
+
+
+def _root_scale(node: PlanNode, size: Size) -> float:
+    generator = _GENERATORS.get(node.func)
+    if generator is not None and generator(dict(node.args)):
+        return 0
+    steps = node_steps(node)
+    if steps is None:
+        return 1
+    return source_scale(steps, size)
+
+
+def decode_scale(context: Context, screens: List[Screen], size: Size) -> float:
+    """
+    Find the smallest scale of an album cover all screens can be rendered from.
+
+    Every layer starts with the cover, so it's
+    enough to look at the first processors of layers.
+    Layers which begin with `fit` or `resize` to a fixed
+    size don't need more pixels than they produce,
+    generators don't need the cover at all and
+    any other processor needs the full cover.
+
+    :param context: current mbg context with updated variables.
+    :param screens: sizes of screens to render.
+    :param size: full size of the cover.
+    :return: scale factor, 1 if the cover must be decoded at full size.
+    """
+    scale = 0.0
+    for plan in build_plans(context, screens):
+        if plan.source_layers:
+            return 1
+        for root in plan.roots:
+            scale = max(scale, _root_scale(root, size))
+            if scale >= 1:
+                return 1
+    return scale
+
+
+def decode_cover(
+    data: bytes,
+    context: Context,
+    screens: List[Screen],
+    thumbnail: Optional[Image.Image] = None,
+) -> Image.Image:
+    """
+    Decode an album cover at the scale the configured layers need.
+
+    :param data: encoded album cover.
+    :param context: current mbg context with updated variables.
+    :param screens: sizes of screens to render.
+    :param thumbnail: cover decoded by `decode_thumbnail`,
+        it's reused if it was decoded at full size.
+    :return: RGBA image.
+    """
+    with Image.open(BytesIO(data)) as header:
+        full_size = header.size
+    if thumbnail is not None and thumbnail.size == full_size:
+        return thumbnail.copy()
+    scale = decode_scale(context, screens, full_size)
+    if scale >= 1:
+        return decode_image(data)
+    size = (
+        max(math.ceil(full_size[0] * scale), 1),
+        max(math.ceil(full_size[1] * scale), 1),
+    )
+    image = decode_image(data, size)
+    logger.debug(
+        f"Decoded {full_size[0]}x{full_size[1]} cover "
+        f"at {image.width}x{image.height}, {size[0]}x{size[1]} is needed",
+    )
+    return image
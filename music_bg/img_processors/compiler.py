@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import inspect
+import typing
+from dataclasses import dataclass
+from string import Formatter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from PIL import Image
+
+from music_bg.config import ImageProcessor, Layer
+from music_bg.utils import template_variables
+
+# Types processor arguments are converted to, in order of preference.
+_NUMERIC_TYPES: Tuple[type, ...] = (int, float)
+
+_formatter = Formatter()
+
+
+def _argument_types(func: Callable[..., Any]) -> Dict[str, Tuple[type, ...]]:
+    """
+    Get types of processor arguments from its signature.
+
+    :param func: processor function.
+    :return: mapping from argument name to allowed types.
+    """
+    try:
+        hints = typing.get_type_hints(func)
+    except Exception:
+        return {}
+    types = {}
+    for name, hint in hints.items():
+        args = typing.get_args(hint) if typing.get_origin(hint) is not None else ()
+        types[name] = tuple(
+            arg
+            for arg in (args or (hint,))
+            if isinstance(arg, type) and arg is not type(None)
+        )
+    return types
+
+
+def coerce(value: Any, types: Tuple[type, ...]) -> Any:
+    """
+    Convert argument value to one of the types.
+
+    Numeric types are preferred, so "10" becomes 10 for
+    an argument annotated as `Union[str, int]`.
+    Values which can't be converted are passed as strings,
+    unless the argument accepts only numbers.
+
+    :param value: value to convert.
+    :param types: allowed types of the argument.
+    :raises ValueError: if value can't be converted to a number.
+    :return: converted value.
+    """
+    numeric = [allowed for allowed in _NUMERIC_TYPES if allowed in types]
+    for numeric_type in numeric:
+        try:
+            return numeric_type(value)
+        except (TypeError, ValueError):
+            continue
+    if numeric and set(types) <= set(_NUMERIC_TYPES):
+        type_names = ", ".join(allowed.__name__ for allowed in numeric)
+        raise ValueError(f"Can't convert {value!r} to {type_names}")
+    return str(value)
+
+
+@dataclass(frozen=True)
+class ArgTemplate:
+    """
+    Compiled processor argument.
+
+    Arguments without variables are converted once
+    and stored in `value`, others keep their template.
+    """
+
+    name: str
+    types: Tuple[type, ...]
+    value: Any = None
+    template: Optional[str] = None
+
+    @property
+    def scalable(self) -> bool:
+        """
+        Whether the argument is a size in pixels.
+
+        Integer arguments are sizes, offsets and strengths
+        for all bundled processors. Arguments that depend
+        on the screen size are already scaled with the screen.
+        """
+        if int not in self.types:
+            return False
+        return self.template is None or "screen" not in template_variables(
+            self.template,
+        )
+
+    def render(self, variables: Mapping[str, Any], scale: float = 1) -> Any:
+        """
+        Substitute variables into the template.
+
+        :param variables: current variables.
+        :param scale: scale factor of pixel sizes.
+        :raises ValueError: if unknown variable was used
+            or the result can't be converted.
+        :return: value of the argument.
+        """
+        if self.template is None:
+            value = self.value
+        else:
+            try:
+                rendered = self.template.format_map(variables)
+            except KeyError as kerr:
+                raise ValueError(f'Unknown variable "{{{kerr.args[0]}}}"') from kerr
+            try:
+                value = coerce(rendered, self.types)
+            except ValueError as exc:
+                raise ValueError(
+                    f'Invalid value of argument "{self.name}": {exc}',
+                ) from exc
+        if scale != 1 and isinstance(value, int) and self.scalable:
+            scaled = round(value * scale)
+            return max(scaled, 1) if value > 0 else scaled
+        return value
+
+
+@dataclass(frozen=True)
+class CompiledProcessor:
+    """Processor call with resolved function and compiled arguments."""
+
+    name: str
+    func: Callable[..., Image.Image]
+    args: Tuple[ArgTemplate, ...]
+
+    def resolve_args(
+        self,
+        variables: Mapping[str, Any],
+        scale: float = 1,
+    ) -> Tuple[Tuple[str, Any], ...]:
+        """
+        Get arguments of the call for current variables.
+
+        :param variables: current variables.
+        :param scale: scale factor of pixel sizes.
+        :return: names and values of arguments.
+        """
+        return tuple((arg.name, arg.render(variables, scale)) for arg in self.args)
+
+
+@dataclass(frozen=True)
+class CompiledLayer:
+    """Layer with compiled processors."""
+
+    name: Union[str, int]
+    processors: Tuple[CompiledProcessor, ...]
+
+
+def compile_arg(name: str, raw_value: Any, types: Tuple[type, ...]) -> ArgTemplate:
+    """
+    Parse template of an argument.
+
+    :param name: name of the argument.
+    :param raw_value: value from config.
+    :param types: allowed types of the argument.
+    :raises ValueError: if template is malformed
+        or constant can't be converted.
+    :return: compiled argument.
+    """
+    template = str(raw_value)
+    try:
+        chunks = list(_formatter.parse(template))
+    except ValueError as exc:
+        raise ValueError(f'Invalid template "{template}": {exc}') from exc
+    if any(field_name is not None for _, field_name, _, _ in chunks):
+        return ArgTemplate(name=name, types=types, template=template)
+    # Escaped braces are unescaped by the parser.
+    constant = "".join(literal for literal, _, _, _ in chunks)
+    try:
+        value = coerce(constant, types)
+    except ValueError as exc:
+        raise ValueError(f'Invalid value of argument "{name}": {exc}') from exc
+    return ArgTemplate(name=name, types=types, value=value)
+
+
+def compile_processor(
+    processor: ImageProcessor,
+    processors: Mapping[str, Callable[..., Image.Image]],
+    variables: Optional[Mapping[str, Any]] = None,
+) -> CompiledProcessor:
+    """
+    Compile processor call from config.
+
+    Arguments are checked against processor's signature.
+
+    :param processor: processor from config.
+    :param processors: available processors.
+    :param variables: available variables providers.
+        If None, variables aren't checked.
+    :raises ValueError: if processor, argument or variable is unknown.
+    :return: compiled processor.
+    """
+    func = processors.get(processor.name)
+    if func is None:
+        raise ValueError(f"Unknown processor {processor.name}")
+    params = list(inspect.signature(func).parameters.values())[1:]
+    accepts_any = any(param.kind is param.VAR_KEYWORD for param in params)
+    known = {param.name for param in params}
+    raw_args = processor.args or {}
+    for arg_name in raw_args:
+        if arg_name not in known and not accepts_any:
+            raise ValueError(
+                f'Unknown argument "{arg_name}" of processor {processor.name}',
+            )
+    missing = [
+        param.name
+        for param in params
+        if param.default is param.empty
+        and param.kind not in {param.VAR_POSITIONAL, param.VAR_KEYWORD}
+        and param.name not in raw_args
+    ]
+    if missing:
+        raise ValueError(
+            f"Missing arguments of processor {processor.name}: {', '.join(missing)}",
+        )
+    types = _argument_types(func)
+    args = tuple(
+        compile_arg(arg_name, arg_value, types.get(arg_name, ()))
+        for arg_name, arg_value in raw_args.items()
+    )
+    if variables is not None:
+        for arg in args:
+            for var_name in template_variables(arg.template or ""):
+                if var_name not in variables:
+                    raise ValueError(f'Unknown variable "{{{var_name}}}"')
+    return CompiledProcessor(name=processor.name, func=func, args=args)
+
+
+def compile_layers(
+    layers: List[Layer],
+    processors: Mapping[str, Callable[..., Image.Image]],
+    variables: Optional[Mapping[str, Any]] = None,
+) -> List[CompiledLayer]:
+    """
+    Compile layers from config.
+
+    :param layers: layers from config.
+    :param processors: available processors.
+    :param variables: available variables providers.
+    :raises ValueError: if config is invalid.
+    :return: compiled layers.
+    """
+    compiled = []
+    for layer in layers:
+        try:
+            layer_processors = tuple(
+                compile_processor(processor, processors, variables)
+                for processor in layer.processors
+            )
+        except ValueError as exc:
+            raise ValueError(f"Invalid layer {layer.name}: {exc}") from exc
+        compiled.append(CompiledLayer(name=layer.name, processors=layer_processors))
+    return compiled
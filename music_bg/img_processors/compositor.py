@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+
+from loguru import logger
+from PIL import Image
+
+from music_bg.utils import is_opaque
+
+# Part of a layer's area its non-transparent part
+# should fit in to be cropped before blending.
+_CROP_THRESHOLD = 0.5
+
+
+def _visible_layers(
+    layers: List[Image.Image],
+    size: Tuple[int, int],
+) -> Tuple[List[Image.Image], bool]:
+    """
+    Drop layers hidden under an opaque screen-sized layer.
+
+    :param layers: layer images in blending order.
+    :param size: size of the screen.
+    :return: visible layers and whether the lowest of them
+        covers the whole screen.
+    """
+    for index in range(len(layers) - 1, -1, -1):
+        layer = layers[index]
+        if layer.size == size and is_opaque(layer):
+            if index:
+                logger.debug(f"Skipping {index} layers hidden under an opaque layer")
+            return layers[index:], True
+    return layers, False
+
+
+def _blend(canvas: Image.Image, layer: Image.Image) -> Image.Image:
+    """
+    Blend a layer over the canvas.
+
+    Layer is centered on the canvas. Opaque layers
+    are copied without blending and mostly transparent
+    layers are cropped to their visible part.
+
+    :param canvas: RGBA image to draw on.
+    :param layer: layer image.
+    :return: canvas with the layer on it.
+    """
+    left = (canvas.width - layer.width) // 2
+    top = (canvas.height - layer.height) // 2
+    if is_opaque(layer):
+        canvas.paste(layer, (left, top))
+        return canvas
+    if layer.size == canvas.size:
+        return Image.alpha_composite(canvas, layer)
+    bbox = layer.getbbox(alpha_only=True)
+    if bbox is None:
+        return canvas
+    bbox_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if bbox_area > layer.width * layer.height * _CROP_THRESHOLD:
+        bbox = (0, 0, layer.width, layer.height)
+    canvas.alpha_composite(layer, (left + bbox[0], top + bbox[1]), bbox)
+    return canvas
+
+
+def composite(layers: List[Image.Image], size: Tuple[int, int]) -> Image.Image:
+    """
+    Blend layers centered on the screen.
+
+    Layers below the topmost opaque layer of
+    the screen size are skipped, since they are
+    completely hidden by it, and the copy of this
+    layer is used as a canvas instead of
+    a transparent one.
+
+    :param layers: layer images in blending order,
+        from the bottom to the top.
+    :param size: size of the screen.
+    :raises ValueError: if layer is bigger than the screen.
+    :return: blended image.
+    """
+    normalized = []
+    for layer in layers:
+        if layer.width > size[0] or layer.height > size[1]:
+            raise ValueError("Layer image bigger than biggest screen.")
+        has_alpha = layer.mode != "RGBA" and "A" in layer.getbands()
+        normalized.append(layer.convert("RGBA") if has_alpha else layer)
+    visible, opaque = _visible_layers(normalized, size)
+    if opaque:
+        base = visible.pop(0)
+        canvas = base.copy() if base.mode == "RGBA" else base.convert("RGBA")
+    else:
+        canvas = Image.new("RGBA", size)
+    for layer in visible:
+        canvas = _blend(canvas, layer)
+    return canvas
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from PIL import Image
+
+from music_bg.img_processors.fit import fit
+from music_bg.img_processors.plan import PlanNode, RenderPlan
+from music_bg.img_processors.resize import resize
+
+# Region of the input image in its coordinates.
+Box = Tuple[float, float, float, float]
+Size = Tuple[int, int]
+Step = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+# Box may go out of the image by this much due to float errors.
+_BOX_TOLERANCE = 1e-6
+
+
+def _fit_step(box: Box, size: Size, width: Any, height: Any) -> Tuple[Box, Size]:
+    """Mirror of `fit`: resize to cover the size and crop the center."""
+    width = int(width)
+    height = int(height)
+    scale_factor = max(width / size[0], height / size[1])
+    resized = (int(size[0] * scale_factor), int(size[1] * scale_factor))
+    crop = (
+        (resized[0] - width) // 2,
+        (resized[1] - height) // 2,
+        (resized[0] + width) // 2,
+        (resized[1] + height) // 2,
+    )
+    x_scale = (box[2] - box[0]) / resized[0]
+    y_scale = (box[3] - box[1]) / resized[1]
+    new_box = (
+        box[0] + crop[0] * x_scale,
+        box[1] + crop[1] * y_scale,
+        box[0] + crop[2] * x_scale,
+        box[1] + crop[3] * y_scale,
+    )
+    return new_box, (crop[2] - crop[0], crop[3] - crop[1])
+
+
+def _resize_step(
+    box: Box,
+    size: Size,
+    width: Any = None,
+    height: Any = None,
+    factor: Any = None,
+) -> Tuple[Box, Size]:
+    """Mirror of `resize`: scale the whole image."""
+    new_size = (int(width or size[0]), int(height or size[1]))
+    if factor is not None:
+        new_size = (int(size[0] * float(factor)), int(size[1] * float(factor)))
+    return box, new_size
+
+
+# Geometric processors and functions that compute their effect.
+GEOMETRY_STEPS: Dict[str, Tuple[Callable[..., Image.Image], Callable[..., Any]]] = {
+    "fit": (fit, _fit_step),
+    "resize": (resize, _resize_step),
+}
+
+
+def _step_kind(func: Callable[..., Image.Image]) -> Optional[str]:
+    for kind, (processor, _) in GEOMETRY_STEPS.items():
+        if func is processor:
+            return kind
+    return None
+
+
+def apply_steps(image: Image.Image, steps: Tuple[Step, ...]) -> Image.Image:
+    """
+    Apply geometric processors one by one.
+
+    :param image: input image.
+    :param steps: kinds of geometric processors and their arguments.
+    :return: transformed image.
+    """
+    for kind, args in steps:
+        image = GEOMETRY_STEPS[kind][0](image, **dict(args))
+    return image
+
+
+def transform(image: Image.Image, steps: Tuple[Step, ...]) -> Image.Image:
+    """
+    Apply a chain of geometric processors with a single resampling.
+
+    Steps are composed into a region of the input image and
+    the size of the result, so the image is resized once with
+    `Image.resize(size, box=region)`. Parts of the image
+    cropped by the chain are never resampled and steps which
+    don't change the image are skipped.
+
+    If the region goes out of the image, for example
+    because of rounding in `fit`, processors are applied
+    one by one to get exactly the same result.
+
+    :param image: input image.
+    :param steps: kinds of geometric processors and their arguments.
+    :return: transformed image.
+    """
+    box: Box = (0.0, 0.0, float(image.width), float(image.height))
+    size: Size = image.size
+    for kind, args in steps:
+        box, size = GEOMETRY_STEPS[kind][1](box, size, **dict(args))
+    inside = (
+        box[0] >= -_BOX_TOLERANCE
+        and box[1] >= -_BOX_TOLERANCE
+        and box[2] <= image.width + _BOX_TOLERANCE
+        and box[3] <= image.height + _BOX_TOLERANCE
+    )
+    if not inside or size[0] <= 0 or size[1] <= 0:
+        return apply_steps(image, steps)
+    box = (
+        max(box[0], 0),
+        max(box[1], 0),
+        min(box[2], image.width),
+        min(box[3], image.height),
+    )
+    if size == image.size and box == (0, 0, image.width, image.height):
+        return image
+    return image.resize(size, box=box)
+
+
+def source_scale(steps: Tuple[Step, ...], size: Size) -> float:
+    """
+    Find how much an image can be shrunk before a chain of geometric processors.
+
+    The chain must produce an image of the same size
+    from the shrunk image, so chains whose result
+    depends on the input size, like `resize(factor=0.5)`,
+    can't shrink it.
+
+    :param steps: kinds of geometric processors and their arguments.
+    :param size: size of the input image.
+    :return: scale factor, 1 if the image can't be shrunk.
+    """
+    box: Box = (0.0, 0.0, float(size[0]), float(size[1]))
+    fixed = False
+    for kind, args in steps:
+        kwargs = dict(args)
+        if kind == "resize" and kwargs.get("factor") is None:
+            sizes = (kwargs.get("width"), kwargs.get("height"))
+            if not fixed and any(sizes) and not all(sizes):
+                # Only one side is set, so the aspect ratio depends on the input.
+                return 1
+            fixed = fixed or all(sizes)
+        fixed = fixed or kind == "fit"
+        box, size = GEOMETRY_STEPS[kind][1](box, size, **kwargs)
+    width = box[2] - box[0]
+    height = box[3] - box[1]
+    if not fixed or width <= 0 or height <= 0:
+        return 1
+    return min(max(size[0] / width, size[1] / height), 1)
+
+
+def node_steps(node: PlanNode) -> Optional[Tuple[Step, ...]]:
+    """
+    Get geometric processors applied by a node and its only descendants.
+
+    :param node: node of a render plan, fused or not.
+    :return: kinds of geometric processors and their arguments
+        or None if the node isn't geometric.
+    """
+    if node.func is transform:
+        steps: Tuple[Step, ...] = dict(node.args)["steps"]
+        return steps
+    if _step_kind(node.func) is None:
+        return None
+    return tuple(
+        (kind, link.args)
+        for link in _chain(node)
+        if (kind := _step_kind(link.func)) is not None
+    )
+
+
+def _chain(node: PlanNode) -> Iterator[PlanNode]:
+    """Yield the node and its only descendants which can be fused."""
+    yield node
+    while (
+        len(node.children) == 1
+        and not node.layers
+        and _step_kind(node.children[0].func) is not None
+    ):
+        node = node.children[0]
+        yield node
+
+
+def _fuse_node(node: PlanNode) -> None:
+    steps = node_steps(node)
+    if steps is not None and node.func is not transform:
+        chain = list(_chain(node))
+        last = chain[-1]
+        node.label = " -> ".join(link.describe() for link in chain)
+        node.processor = "+".join(link.processor for link in chain)
+        node.func = transform
+        node.args = (("steps", steps),)
+        node.layers = last.layers
+        node.children = last.children
+    for child in node.children:
+        _fuse_node(child)
+
+
+def fuse_geometry(plan: RenderPlan) -> RenderPlan:
+    """
+    Merge chained geometric processors of a render plan.
+
+    Every `fit` and `resize` node is replaced with `transform`
+    of itself and all following geometric nodes, as long as
+    intermediate images aren't used by other layers or branches,
+    so shared prefixes are still computed once.
+
+    :param plan: render plan.
+    :return: the same plan with fused nodes.
+    """
+    for root in plan.roots:
+        _fuse_node(root)
+    return plan
@@ -1,4 +1,5 @@
 import math
+from functools import lru_cache
 from typing import Union
 
 import numpy as np
@@ -7,6 +8,28 @@ from PIL import Image
 from music_bg.utils import colorstr_to_tuple
 
 
+@lru_cache(maxsize=4)
+def _radial_distances(width: int, height: int) -> np.ndarray:
+    """
+    Compute normalized distances to the center of an image.
+
+    Distances are on a scale from 0 to 1 relatively
+    to the half of a diagonal of a square with side equal to width.
+    Result is cached per image size, so only colors are applied
+    when the same size is requested again.
+
+    :param width: width of an image.
+    :param height: height of an image.
+    :return: read-only float32 array with shape (height, width).
+    """
+    xs = np.arange(width, dtype=np.float32) - width / 2
+    ys = np.arange(height, dtype=np.float32) - height / 2
+    distances: np.ndarray = np.hypot(xs[np.newaxis, :], ys[:, np.newaxis])
+    distances /= math.sqrt(2) * width / 2
+    distances.flags.writeable = False
+    return distances
+
+
 def radial_gradient(
     image: Image.Image,
     inner_color: str,
@@ -39,44 +62,15 @@ def radial_gradient(
     inner_color_tup = colorstr_to_tuple(inner_color)
     outer_color_tup = colorstr_to_tuple(outer_color)
 
-    sqrt2 = math.sqrt(2)
-
-    result_img = Image.new("RGBA", (width, height))
-
-    distances = np.full((width, height), None)
-
-    for x in range(width):
-        for y in range(height):
-            if distances[x, y] is None:
-                distance_to_center = math.sqrt(
-                    (x - width / 2) ** 2 + (y - height / 2) ** 2,
-                )
-
-                # Make it on a scale from 0 to 1
-                distance_to_center = distance_to_center / (sqrt2 * width / 2)
-                distances[x, y] = distance_to_center
-                distances[width - x - 1, y] = distance_to_center
-                distances[x, height - y - 1] = distance_to_center
-                distances[
-                    width - x - 1,
-                    height - y - 1,
-                ] = distance_to_center
-
-            distance_to_center = distances[x, y]
-
-            # Calculate r, g, b values
-            red = outer_color_tup[0] * distance_to_center + inner_color_tup[0] * (
-                1 - distance_to_center
-            )
-            green = outer_color_tup[1] * distance_to_center + inner_color_tup[1] * (
-                1 - distance_to_center
-            )
-            blue = outer_color_tup[2] * distance_to_center + inner_color_tup[2] * (
-                1 - distance_to_center
-            )
-
-            result_img.putpixel(
-                (x, y),
-                (int(red), int(green), int(blue)),
-            )
-    return result_img
+    distances = _radial_distances(width, height)
+
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    channel = np.empty((height, width), dtype=np.float32)
+    for index, (inner, outer) in enumerate(zip(inner_color_tup, outer_color_tup)):
+        # Linear interpolation between inner and outer colors.
+        np.multiply(distances, outer - inner, out=channel)
+        channel += inner
+        np.clip(channel, 0, 255, out=channel)
+        pixels[..., index] = channel
+    pixels[..., 3] = 255
+    return Image.fromarray(pixels)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from PIL import Image
+
+from music_bg.img_processors.compiler import CompiledLayer
+
+LayerName = Union[str, int]
+
+
+@dataclass
+class PlanNode:
+    """
+    Single processor invocation in a render plan.
+
+    Result of a node is passed to all its children
+    and is used as a final image of layers listed in `layers`.
+    """
+
+    processor: str
+    func: Callable[..., Image.Image]
+    args: Tuple[Tuple[str, Any], ...]
+    layers: List[LayerName] = field(default_factory=list)
+    children: List[PlanNode] = field(default_factory=list)
+    # Description of the call, if it differs from processor's one.
+    label: Optional[str] = None
+
+    def walk(self, depth: int = 0) -> Iterator[Tuple[int, PlanNode]]:
+        """
+        Iterate over all nodes of a subtree.
+
+        :param depth: depth of current node.
+        :yield: depth and node.
+        """
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def describe(self) -> str:
+        """
+        Get human-readable processor call.
+
+        :return: processor call with arguments.
+        """
+        if self.label is not None:
+            return self.label
+        args = ", ".join(f"{name}={value!r}" for name, value in self.args)
+        return f"{self.processor}({args})"
+
+
+@dataclass
+class RenderPlan:
+    """
+    Processors of all layers compiled in a tree.
+
+    Layers that start with the same chain of processors
+    with the same arguments share nodes of this chain,
+    so it's computed only once.
+    """
+
+    roots: List[PlanNode] = field(default_factory=list)
+    # Layers without processors.
+    source_layers: List[LayerName] = field(default_factory=list)
+    # Number of processor calls without deduplication.
+    invocations: int = 0
+
+    def nodes(self) -> Iterator[Tuple[int, PlanNode]]:
+        """
+        Iterate over all nodes of a plan.
+
+        :yield: depth and node.
+        """
+        for root in self.roots:
+            yield from root.walk()
+
+    @property
+    def nodes_count(self) -> int:
+        """Number of processor calls required to render all layers."""
+        return sum(1 for _ in self.nodes())
+
+    @property
+    def saved_invocations(self) -> int:
+        """Number of processor calls saved by sharing common prefixes."""
+        return self.invocations - self.nodes_count
+
+
+def build_plan(
+    layers: List[CompiledLayer],
+    variables: Mapping[str, Any],
+    scale: float = 1,
+) -> RenderPlan:
+    """
+    Build a render plan of compiled layers.
+
+    :param layers: compiled layers.
+    :param variables: current variables.
+    :param scale: scale factor of pixel sizes in arguments.
+    :return: render plan.
+    """
+    plan = RenderPlan()
+    for layer in layers:
+        if not layer.processors:
+            plan.source_layers.append(layer.name)
+            continue
+        siblings = plan.roots
+        node = None
+        for processor in layer.processors:
+            plan.invocations += 1
+            args = processor.resolve_args(variables, scale)
+            node = next(
+                (
+                    sibling
+                    for sibling in siblings
+                    if sibling.processor == processor.name and sibling.args == args
+                ),
+                None,
+            )
+            if node is None:
+                node = PlanNode(
+                    processor=processor.name,
+                    func=processor.func,
+                    args=args,
+                )
+                siblings.append(node)
+            siblings = node.children
+        if node is not None:
+            node.layers.append(layer.name)
+    return plan
@@ -1,9 +1,73 @@
-from typing import Optional, Union
+from functools import lru_cache
+from typing import Optional, Tuple, Union
 
 from PIL import Image, ImageDraw, ImageFont
 
 from music_bg.utils import color_to_hexstr, invert_color, most_frequent_color
 
+# left, top, right, bottom
+BBox = Tuple[int, int, int, int]
+
+
+@lru_cache(maxsize=16)
+def _load_font(font: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Load a font of given size.
+
+    Fonts are cached for the whole process,
+    so a font file is read only once.
+
+    :param font: name or path of a font.
+    :param size: size of a font.
+    :return: loaded font.
+    """
+    return ImageFont.truetype(font, size)
+
+
+@lru_cache(maxsize=64)
+def _text_mask(text: str, font: str, size: int) -> Tuple[Image.Image, BBox]:
+    """
+    Render a text as a mask.
+
+    Masks are cached, so rendering the same
+    text again is a single paste. They must not be modified.
+
+    :param text: text to render.
+    :param font: name or path of a font.
+    :param size: size of a font.
+    :return: coverage of text pixels and its bbox relative to
+        the point where text starts.
+    """
+    img_font = _load_font(font, size)
+    bbox = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(
+        (0, 0),
+        text,
+        font=img_font,
+    )
+    left, top, right, bottom = (int(coord) for coord in bbox)
+    mask = Image.new("L", (max(right - left, 0), max(bottom - top, 0)))
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=img_font)
+    return mask, (left, top, right, bottom)
+
+
+def _background_color(image: Image.Image, box: BBox) -> Tuple[int, int, int]:
+    """
+    Find the most frequent color under a text.
+
+    :param image: input image.
+    :param box: bbox of the text on the image.
+    :return: color tuple.
+    """
+    region = (
+        max(box[0], 0),
+        max(box[1], 0),
+        min(box[2], image.width),
+        min(box[3], image.height),
+    )
+    if region[0] >= region[2] or region[1] >= region[3]:
+        return most_frequent_color(image.copy())
+    return most_frequent_color(image.crop(region))
+
 
 def img_print(
     image: Image.Image,
@@ -23,7 +87,8 @@ def img_print(
     :param image: input image.
     :param text: text to render.
     :param color: text color
-        if color is None, inverted to the most common one is chosen.
+        if color is None, inverted to the most common one
+        under the text is chosen.
     :param font: font to use, defaults to "DejaVuSans"
     :param font_size: size of a font, defaults to 30
     :param start_x: where to start rendering text on the x axis,
@@ -32,10 +97,7 @@ def img_print(
         if start_y is None, center of the image is chosen.
     :return: image with text on it.
     """
-    img_font = ImageFont.truetype(font, int(font_size))
-    draw = ImageDraw.Draw(image)
-    # left, top, right, bottom
-    _, _, text_w, text_h = draw.textbbox((0, 0), text, font=img_font)
+    mask, (left, top, text_w, text_h) = _text_mask(text, font, int(font_size))
 
     if start_x is None:
         start_x = int((image.width - text_w) // 2)
@@ -43,13 +105,12 @@ def img_print(
     if start_y is None:
         start_y = int((image.height - text_h) // 2)
 
+    position = (int(start_x) + left, int(start_y) + top)
+    box = (*position, position[0] + mask.width, position[1] + mask.height)
+
     if color is None:
-        color = color_to_hexstr(invert_color(most_frequent_color(image.copy())))
+        color = color_to_hexstr(invert_color(_background_color(image, box)))
 
-    draw.text(
-        xy=(int(start_x), int(start_y)),
-        text=text,
-        fill=color,
-        font=img_font,
-    )
+    if mask.width and mask.height:
+        image.paste(color, box, mask)
     return image
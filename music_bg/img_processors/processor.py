@@ -1,56 +1,310 @@
+import itertools
+import time
+import traceback
+from collections import ChainMap
 from functools import partial
-from multiprocessing import Pool
-from typing import Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple
 
 from loguru import logger
 from PIL import Image
 
-from music_bg.config import Layer
-from music_bg.context import Context
+from music_bg.context import Context, Screen
+from music_bg.img_processors.compositor import composite
+from music_bg.img_processors.geometry import fuse_geometry
+from music_bg.img_processors.plan import (
+    LayerName,
+    PlanNode,
+    RenderPlan,
+    build_plan,
+)
+from music_bg.pool import SharedImage
 
+Spans = List[Tuple[str, float]]
+# Layers of a branch processed by a layer worker.
+SharedBranch = Tuple[List[Tuple[LayerName, SharedImage]], Spans]
 
-def process_layer(
+
+def process_branch(
     image: Image.Image,
+    node: PlanNode,
+    elapsed: float = 0,
+) -> Tuple[List[Tuple[LayerName, Image.Image]], Spans]:
+    """
+    Process a branch of a render plan.
+
+    This function applies processor of the node on an image
+    and recursively processes all children of the node
+    with the result.
+
+    Input image may be modified by processors,
+    so the caller must pass its own copy.
+
+    :param image: input image of the node.
+    :param node: render plan node.
+    :param elapsed: time spent on parent nodes.
+    :return: Names of the layers with processed images and
+        durations of processors and layers.
+    """
+    logger.debug(f"Applying {node.describe()} for layers {node.layers}")
+    start = time.perf_counter()
+    image = node.func(image, **dict(node.args))
+    duration = time.perf_counter() - start
+    elapsed += duration
+
+    results = [(layer_name, image) for layer_name in node.layers]
+    spans = [(f"processor:{node.processor}", duration)]
+    spans.extend((f"layer:{layer_name}", elapsed) for layer_name in node.layers)
+    for index, child in enumerate(node.children):
+        # Processors may change input image,
+        # so it's copied for every child, but the last one
+        # if no layer uses it.
+        child_image = image
+        if node.layers or index < len(node.children) - 1:
+            child_image = image.copy()
+        child_results, child_spans = process_branch(child_image, child, elapsed)
+        results.extend(child_results)
+        spans.extend(child_spans)
+    return results, spans
+
+
+def process_shared_branch(
+    source: SharedImage,
+    node: PlanNode,
+) -> SharedBranch:
+    """
+    Process a branch of a render plan in a layer worker.
+
+    Only the handle of the source image and the plan node
+    with resolved arguments are sent to the worker.
+    Layer images are returned through shared memory,
+    the caller must unlink them.
+
+    :param source: album cover in shared memory.
+    :param node: render plan node.
+    :return: Names of the layers with shared images and
+        durations of processors and layers.
+    """
+    results, spans = process_branch(source.load(), node)
+    # Several layers may share an image, it's copied only once.
+    shared: Dict[int, SharedImage] = {}
+    try:
+        for _, layer in results:
+            if id(layer) not in shared:
+                shared[id(layer)] = SharedImage.from_image(layer)
+    except Exception:
+        for handle in shared.values():
+            handle.unlink()
+        raise
+    return [(name, shared[id(layer)]) for name, layer in results], spans
+
+
+def _try_shared_branch(
+    source: SharedImage,
+    node: PlanNode,
+) -> Tuple[Optional[SharedBranch], Optional[Exception]]:
+    """
+    Process a branch in a layer worker and return its error instead of raising.
+
+    Pool.map drops results of all branches if one of them fails,
+    so the daemon wouldn't be able to unlink images of the others.
+
+    :param source: album cover in shared memory.
+    :param node: render plan node.
+    :return: result of the branch or the error it raised.
+    """
+    try:
+        return process_shared_branch(source, node), None
+    except Exception as exc:
+        exc.add_note(traceback.format_exc())
+        return None, exc
+
+
+def _receive_layers(
+    layers: List[Tuple[LayerName, SharedImage]],
+) -> List[Tuple[LayerName, Image.Image]]:
+    images: Dict[SharedImage, Image.Image] = {}
+    for _, handle in layers:
+        if handle not in images:
+            images[handle] = handle.load(unlink=True)
+    return [(name, images[handle]) for name, handle in layers]
+
+
+def _map_branches(
+    image: Image.Image,
+    context: Context,
+    roots: List[PlanNode],
+) -> List[Tuple[List[Tuple[LayerName, Image.Image]], Spans]]:
+    """
+    Process branches of render plans with the worker pool.
+
+    The album cover is put into shared memory once,
+    so neither the cover nor the context is pickled
+    for every branch.
+
+    :param image: album cover.
+    :param context: current music_bg context.
+    :param roots: root nodes of render plans.
+    :return: layers and spans of every branch.
+    """
+    if context.pool.in_process:
+        # Processors may change their input, so every branch
+        # gets its own copy of the cover, like in layer workers,
+        # and the cover itself is left for layers without processors.
+        return [process_branch(image.copy(), root) for root in roots]
+    source = SharedImage.from_image(image)
+    try:
+        outcomes = context.pool.map(partial(_try_shared_branch, source), roots)
+    finally:
+        source.unlink()
+    shared = [branch for branch, _ in outcomes if branch is not None]
+    errors = [error for _, error in outcomes if error is not None]
+    if errors:
+        for handle in {handle for layers, _ in shared for _, handle in layers}:
+            handle.unlink()
+        raise errors[0]
+    return [(_receive_layers(layers), spans) for layers, spans in shared]
+
+
+def _scale_preview_layer(
+    layer: Image.Image,
+    screen: Screen,
+    scale: float,
+) -> Image.Image:
+    """
+    Scale a preview layer whose size doesn't depend on arguments.
+
+    Sizes of layers like `load_img` don't come from processor
+    arguments, so they aren't scaled with the screen.
+
+    :param layer: layer rendered for the preview.
+    :param screen: size of the preview.
+    :param scale: scale factor of the preview.
+    :return: layer scaled down if it's bigger than the preview.
+    """
+    if layer.width <= screen.width and layer.height <= screen.height:
+        return layer
+    return layer.resize(
+        (max(round(layer.width * scale), 1), max(round(layer.height * scale), 1)),
+    )
+
+
+def build_plans(
     context: Context,
-    layer: Layer,
-) -> Tuple[Union[str, int], Image.Image]:
+    screens: List[Screen],
+    scale: float = 1,
+) -> List[RenderPlan]:
     """
-    Process image layer.
+    Build render plans of configured layers for several screens.
 
-    This function sequentially applies image processors
-    from the configuration on an album cover.
+    :param context: current music_bg context with updated variables.
+    :param screens: sizes of screens to render.
+    :param scale: scale factor of pixel sizes in arguments.
+    :return: plans in the order of screens.
+    """
+    plans = []
+    for screen in screens:
+        plan = build_plan(
+            context.layers,
+            ChainMap({"screen": screen}, context.variables),
+            scale,
+        )
+        if context.config.fuse_geometry:
+            fuse_geometry(plan)
+        plans.append(plan)
+    return plans
 
-    :param image: Album cover.
-    :param context: Current MBG context.
-    :param layer: Current layer.
 
-    :raises ValueError: if unknown variable was used in config.
+def process_images(
+    image: Image.Image,
+    context: Context,
+    screens: List[Screen],
+    scale: float = 1,
+) -> List[Image.Image]:
+    """
+    Process album cover for several screen sizes.
 
-    :return: Name of the layer and processed image.
+    Layers of all screens are processed by
+    the worker pool at once.
+
+    If scale is less than 1, layers are rendered
+    for a smaller screen with pixel sizes in processor
+    arguments scaled down and the result is upscaled
+    to the screen size. It's a fast preview of
+    the full size wallpaper. Layers bigger than
+    the smaller screen, like loaded images, are scaled down too.
+
+    :param image: album cover.
+    :param context: current music_bg context.
+    :param screens: sizes of screens to render.
+    :param scale: scale factor of rendering.
+    :raises ValueError: if layer image bigger than the screen.
+    :returns: processed images in the order of screens.
     """
-    image = image.copy()
-    for processor in layer.processors:
-        processor_func = context.get_processor(processor.name)
-        logger.debug(f"Applying {processor.name} on layer {layer.name}")
-        if not processor.args:
-            image = processor_func(image)
-            continue
+    if not context.config.layers:
+        return []
 
-        arguments = {}
-        for arg, arg_value in processor.args.items():
-            try:
-                arguments[arg] = str(arg_value).format_map(context.variables)
-            except KeyError as kerr:
-                raise ValueError(f'Unknown variable "{{{kerr.args[0]}}}"') from kerr
+    blender = context.config.get_blender()
+    targets = [
+        Screen(
+            width=max(round(screen.width * scale), 1),
+            height=max(round(screen.height * scale), 1),
+        )
+        for screen in screens
+    ]
 
-        image = processor_func(image, **arguments)
+    plans = build_plans(context, targets, scale)
+    for screen, plan in zip(targets, plans, strict=True):
+        logger.debug(
+            f"Render plan for {screen.width}x{screen.height} has "
+            f"{plan.nodes_count} processor calls, "
+            f"{plan.saved_invocations} saved by sharing common prefixes",
+        )
+    with context.metrics.span("processors"):
+        branches = _map_branches(
+            image,
+            context,
+            [root for plan in plans for root in plan.roots],
+        )
 
-    return layer.name, image
+    source = image
+    if scale != 1 and any(plan.source_layers for plan in plans):
+        source = image.resize(
+            (max(round(image.width * scale), 1), max(round(image.height * scale), 1)),
+        )
+    results = []
+    branches_iter = iter(branches)
+    for screen, plan in zip(targets, plans, strict=True):
+        layers_map: Dict[LayerName, Image.Image] = dict.fromkeys(
+            plan.source_layers,
+            source,
+        )
+        for branch_layers, spans in itertools.islice(branches_iter, len(plan.roots)):
+            layers_map.update(branch_layers)
+            context.metrics.record_many(spans)
+        if scale != 1:
+            layers_map = {
+                name: _scale_preview_layer(layer, screen, scale)
+                for name, layer in layers_map.items()
+            }
+        with context.metrics.span("composite"):
+            results.append(
+                composite(
+                    [layers_map[blend_index] for blend_index in blender],
+                    (screen.width, screen.height),
+                ),
+            )
+    if scale != 1:
+        results = [
+            result.resize((screen.width, screen.height), Image.Resampling.BILINEAR)
+            for result, screen in zip(results, screens, strict=True)
+        ]
+    return results
 
 
 def process_image(
     image: Image.Image,
     context: Context,
+    scale: float = 1,
 ) -> Optional[Image.Image]:  # : WPS210
     """
     Process album cover according to the config.
@@ -60,29 +314,11 @@ def process_image(
 
     :param image: album cover.
     :param context: current music_bg context.
+    :param scale: scale factor of rendering, see `process_images`.
     :raises ValueError: if layer image bigger than the screen.
     :returns: processed image.
     """
-    if not context.config.layers:
+    processed = process_images(image, context, [context.screen], scale)
+    if not processed:
         return None
-
-    blender = context.config.blender
-    if not blender:
-        blender = [layer.name for layer in context.config.layers]
-
-    layers = Pool().map(partial(process_layer, image, context), context.config.layers)
-    layers_map = dict(layers)
-
-    image = Image.new("RGBA", (context.screen.width, context.screen.height))
-    for blend_index in blender:
-        overlay_img = layers_map[blend_index]
-        if overlay_img.height > image.height or overlay_img.width > image.width:
-            raise ValueError("Layer image bigger than biggest screen.")
-        image.alpha_composite(
-            overlay_img,
-            (
-                (image.width - overlay_img.width) // 2,
-                (image.height - overlay_img.height) // 2,
-            ),
-        )
-    return image
+    return processed[0]
@@ -1,13 +1,13 @@
-from typing import Optional
+from typing import Union
 
 from PIL.Image import Image
 
 
 def resize(
     image: Image,
-    width: Optional[str] = None,
-    height: Optional[str] = None,
-    factor: Optional[str] = None,
+    width: Union[str, int, None] = None,
+    height: Union[str, int, None] = None,
+    factor: Union[str, float, None] = None,
 ) -> Image:
     """
     Resize image with given size.
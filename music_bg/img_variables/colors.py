@@ -1,13 +1,8 @@
 from dataclasses import dataclass, field
 
 from music_bg.context import Context
-from music_bg.utils import (
-    color_to_hexstr,
-    colorstr_to_tuple,
-    get_contrasting_accent_colors,
-    invert_color,
-    most_frequent_color,
-)
+from music_bg.palette import extract_palette
+from music_bg.utils import color_to_hexstr, colorstr_to_tuple, invert_color
 
 
 @dataclass
@@ -43,14 +38,20 @@ class ColorsVars:
 
 def colors_var(context: Context) -> ColorsVars:
     """Setup color-related variables."""
-    if context.src_image is None:
+    image = context.thumbnail if context.thumbnail is not None else context.src_image
+    if image is None:
         return ColorsVars()
 
-    mf_color = color_to_hexstr(most_frequent_color(context.src_image.copy()))
-    bg_accent, fg_accent = get_contrasting_accent_colors(context.src_image.copy(), 4)
+    # Five clusters and contrast ratio of 4 are what colors
+    # were chosen with before, configs rely on that.
+    palette = extract_palette(
+        image,
+        num_colors=5,
+        min_contrast_ratio=4,
+    )
 
     return ColorsVars(
-        most_frequent_color=mf_color,
-        accent_color=color_to_hexstr(fg_accent),
-        second_accent_color=color_to_hexstr(bg_accent),
+        most_frequent_color=color_to_hexstr(palette.dominant),
+        accent_color=color_to_hexstr(palette.foreground),
+        second_accent_color=color_to_hexstr(palette.background),
     )
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+from loguru import logger
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(ordered: list[float], quantile: float) -> float:
+    index = min(int(quantile * len(ordered)), len(ordered) - 1)
+    return ordered[index]
+
+
+class Metrics:
+    """
+    Rolling timings of rendering stages.
+
+    For every span only the last `window` durations
+    are kept to compute quantiles, while count and sum
+    are accumulated for the whole daemon lifetime.
+    """
+
+    def __init__(self, window: int = 100) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, Tuple[int, float]] = {}
+        self.last: Dict[str, float] = {}
+
+    def resize(self, window: int) -> None:
+        """
+        Change number of kept durations.
+
+        :param window: new number of durations per span.
+        """
+        with self._lock:
+            self.window = window
+            self._samples = {
+                name: deque(samples, maxlen=window)
+                for name, samples in self._samples.items()
+            }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, duration: float) -> None:
+        """
+        Add duration of a span.
+
+        :param name: name of a span.
+        :param duration: duration in seconds.
+        """
+        with self._lock:
+            samples = self._samples.setdefault(name, deque(maxlen=self.window))
+            samples.append(duration)
+            count, total = self._totals.get(name, (0, 0.0))
+            self._totals[name] = (count + 1, total + duration)
+            self.last[name] = duration
+
+    def record_many(self, spans: Iterable[Tuple[str, float]]) -> None:
+        """
+        Add durations of multiple spans.
+
+        :param spans: names of spans and their durations.
+        """
+        for name, duration in spans:
+            self.record(name, duration)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Measure duration of a block of code.
+
+        :param name: name of a span.
+        :yield: nothing.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get statistics of all spans.
+
+        :return: mapping from span name to its statistics.
+        """
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                count, total = self._totals[name]
+                stats = {"count": count, "sum": total, "last": self.last[name]}
+                for quantile in QUANTILES:
+                    stats[f"p{int(quantile * 100)}"] = _quantile(ordered, quantile)
+                result[name] = stats
+            return result
+
+    def format_summary(self) -> str:
+        """
+        Format statistics as a human-readable table.
+
+        :return: table with a line per span.
+        """
+        lines = [f"{'span':<40}{'last':>10}{'p50':>10}{'p95':>10}{'count':>8}"]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(
+                f"{name:<40}"
+                f"{stats['last'] * 1000:>8.1f}ms"
+                f"{stats['p50'] * 1000:>8.1f}ms"
+                f"{stats['p95'] * 1000:>8.1f}ms"
+                f"{int(stats['count']):>8}",
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """
+        Format statistics in Prometheus text exposition format.
+
+        :return: summary metric with quantiles for every span.
+        """
+        metric = "music_bg_span_duration_seconds"
+        lines = [
+            f"# HELP {metric} Duration of music_bg rendering stages.",
+            f"# TYPE {metric} summary",
+        ]
+        for name, stats in sorted(self.summary().items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for quantile in QUANTILES:
+                value = stats[f"p{int(quantile * 100)}"]
+                lines.append(
+                    f'{metric}{{span="{label}",quantile="{quantile}"}} {value}',
+                )
+            lines.append(f'{metric}_sum{{span="{label}"}} {stats["sum"]}')
+            lines.append(f'{metric}_count{{span="{label}"}} {int(stats["count"])}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Path) -> None:
+        """
+        Write statistics to a file.
+
+        Files with ".prom" extension are written
+        in Prometheus textfile format, other files as JSON.
+
+        :param path: path to the file.
+        """
+        if path.suffix == ".prom":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2, sort_keys=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(content)
+            tmp_path.replace(path)
+        except OSError as exc:
+            logger.warning(f"Can't export metrics to {path}: {exc}")
+
+    def flush(self, path: Optional[Path], log_summary: bool = False) -> None:
+        """
+        Export statistics and log them if required.
+
+        :param path: path to export file, if any.
+        :param log_summary: log timings summary.
+        """
+        if path is not None:
+            self.export(path.expanduser())
+        if log_summary:
+            logger.info(f"Render timings:\n{self.format_summary()}")
@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import IO, Any, Dict, Union
+
+from PIL import Image
+
+from music_bg.config import OutputConfig, OutputFormat
+from music_bg.utils import is_opaque
+
+# Formats which can't store alpha channel.
+_OPAQUE_FORMATS = frozenset((OutputFormat.JPEG, OutputFormat.PPM))
+
+
+def encoder_options(config: OutputConfig) -> Dict[str, Any]:
+    """
+    Get Pillow's save options for the output format.
+
+    :param config: output configuration.
+    :return: keyword arguments for `Image.save`.
+    """
+    if config.format == OutputFormat.PNG:
+        return {"compress_level": config.compress_level}
+    if config.format == OutputFormat.JPEG:
+        return {"quality": config.quality}
+    if config.format == OutputFormat.WEBP:
+        # The fastest encoding method, quality
+        # is controlled by `quality` option.
+        return {"quality": config.quality, "method": 0}
+    return {}
+
+
+def save_image(
+    image: Image.Image,
+    output: Union[Path, IO[bytes]],
+    config: OutputConfig,
+) -> None:
+    """
+    Encode rendered wallpaper.
+
+    Alpha channel is dropped if the image is opaque
+    or the format doesn't support transparency.
+
+    :param image: rendered wallpaper.
+    :param output: path or file object to write to.
+    :param config: output configuration.
+    """
+    if image.mode == "RGBA" and (config.format in _OPAQUE_FORMATS or is_opaque(image)):
+        image = image.convert("RGB")
+    image.save(output, format=config.format.value, **encoder_options(config))
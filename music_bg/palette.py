@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from music_bg.utils import contrast_ratio, invert_color
+
+Color = Tuple[int, int, int]
+
+# Max width and height of a thumbnail colors are extracted from.
+THUMBNAIL_SIZE = 100
+
+# Number of bits kept per channel when building color histograms.
+_HISTOGRAM_BITS = 5
+_DOMINANT_HISTOGRAM_BITS = 3
+_KMEANS_ITERATIONS = 10
+
+
+@dataclass
+class Palette:
+    """Colors extracted from an image."""
+
+    # The most frequent color.
+    dominant: Color
+    # Colors of the clusters from the most to the least frequent.
+    colors: List[Color]
+    # Contrasting pair of colors.
+    background: Color
+    foreground: Color
+
+
+def _thumbnail_pixels(image: Image.Image, size: int) -> np.ndarray:
+    """
+    Get pixels of a thumbnail of an image.
+
+    :param image: input image.
+    :param size: max width and height of a thumbnail.
+    :return: array of RGB pixels with shape (N, 3).
+    """
+    scale = min(size / image.width, size / image.height, 1)
+    thumb_size = (max(int(image.width * scale), 1), max(int(image.height * scale), 1))
+    if thumb_size != image.size:
+        image = image.resize(
+            thumb_size,
+            Image.Resampling.BICUBIC,
+            reducing_gap=2.0,
+        )
+    return np.asarray(image.convert("RGB")).reshape((-1, 3))
+
+
+def _color_histogram(
+    pixels: np.ndarray,
+    bits: int = _HISTOGRAM_BITS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Group pixels into quantized color bins.
+
+    :param pixels: RGB pixels with shape (N, 3).
+    :param bits: number of bits kept per channel.
+    :return: mean colors of non-empty bins and number of pixels in them.
+    """
+    quantized = (pixels >> (8 - bits)).astype(np.int32)
+    bins = quantized[:, 0] << (bits * 2) | quantized[:, 1] << bits | quantized[:, 2]
+    bins_count = 1 << (bits * 3)
+    counts = np.bincount(bins, minlength=bins_count)
+    used = np.nonzero(counts)[0]
+    sums = np.stack(
+        [
+            np.bincount(bins, weights=pixels[:, channel], minlength=bins_count)[used]
+            for channel in range(3)
+        ],
+        axis=1,
+    )
+    weights = counts[used].astype(np.float64)
+    return sums / weights[:, np.newaxis], weights
+
+
+def _weighted_kmeans(
+    colors: np.ndarray,
+    weights: np.ndarray,
+    num_colors: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster colors with weighted k-means.
+
+    Centers are initialized deterministically, starting
+    from the heaviest color and picking the farthest weighted
+    colors next, so the result is stable between runs.
+
+    :param colors: colors to cluster with shape (N, 3).
+    :param weights: weights of colors.
+    :param num_colors: number of clusters.
+    :return: cluster centers and their weights.
+    """
+    num_colors = min(num_colors, len(colors))
+    centers = [colors[np.argmax(weights)]]
+    distances = np.sum((colors - centers[0]) ** 2, axis=1)
+    for _ in range(1, num_colors):
+        centers.append(colors[np.argmax(weights * distances)])
+        distances = np.minimum(distances, np.sum((colors - centers[-1]) ** 2, axis=1))
+    centers_arr = np.array(centers)
+
+    labels = np.zeros(len(colors), dtype=np.intp)
+    for _ in range(_KMEANS_ITERATIONS):
+        distances_to_centers = np.sum(
+            (colors[:, np.newaxis, :] - centers_arr[np.newaxis, :, :]) ** 2,
+            axis=2,
+        )
+        new_labels = np.argmin(distances_to_centers, axis=1)
+        cluster_weights = np.bincount(new_labels, weights=weights, minlength=num_colors)
+        for channel in range(3):
+            sums = np.bincount(
+                new_labels,
+                weights=weights * colors[:, channel],
+                minlength=num_colors,
+            )
+            non_empty = cluster_weights > 0
+            centers_arr[non_empty, channel] = (
+                sums[non_empty] / cluster_weights[non_empty]
+            )
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    cluster_weights = np.bincount(labels, weights=weights, minlength=num_colors)
+    return centers_arr, cluster_weights
+
+
+def extract_palette(
+    image: Image.Image,
+    num_colors: int = 4,
+    min_contrast_ratio: float = 5.5,
+) -> Palette:
+    """
+    Extract main colors of an image.
+
+    Image is downscaled to THUMBNAIL_SIZE thumbnail
+    and pixels are grouped into a color histogram.
+    The dominant color is the mean color of the most
+    populated bin of a coarse histogram and the other colors
+    are found by clustering bins of a fine histogram
+    with weighted k-means.
+
+    :param image: input image.
+    :param num_colors: number of colors to extract.
+    :param min_contrast_ratio: minimum contrast ratio
+        of the contrasting colors pair.
+    :return: extracted palette.
+    """
+    pixels = _thumbnail_pixels(image, THUMBNAIL_SIZE)
+    coarse_colors, coarse_weights = _color_histogram(pixels, _DOMINANT_HISTOGRAM_BITS)
+    dominant = coarse_colors[np.argmax(coarse_weights)].round().astype(int)
+    bin_colors, bin_weights = _color_histogram(pixels)
+    centers, weights = _weighted_kmeans(bin_colors, bin_weights, num_colors)
+    order = np.argsort(-weights, kind="stable")
+    colors: List[Color] = [
+        (int(red), int(green), int(blue))
+        for red, green, blue in centers[order].round().astype(int)
+    ]
+
+    foreground = colors[0]
+    background = invert_color(foreground)
+    for color in colors[1:]:
+        if contrast_ratio(color, foreground) >= min_contrast_ratio:
+            background = color
+            break
+    return Palette(
+        dominant=(int(dominant[0]), int(dominant[1]), int(dominant[2])),
+        colors=colors,
+        background=background,
+        foreground=foreground,
+    )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.pool import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Iterable, List, Tuple, TypeVar, cast
+
+from loguru import logger
+from PIL import Image
+
+_T = TypeVar("_T")
+
+
+@dataclass(frozen=True)
+class SharedImage:
+    """
+    Image stored in shared memory.
+
+    Only the name of the memory block and the image geometry
+    are pickled, so images are passed between the daemon
+    and layer workers without being sent through pipes.
+    The block exists until `unlink` is called.
+    """
+
+    name: str
+    mode: str
+    size: Tuple[int, int]
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> SharedImage:
+        """
+        Copy image to a new block of shared memory.
+
+        :param image: image to share.
+        :return: handle of the shared image.
+        """
+        data = image.tobytes()
+        shm = SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            cast(memoryview, shm.buf)[: len(data)] = data
+        finally:
+            shm.close()
+        return cls(name=shm.name, mode=image.mode, size=image.size)
+
+    def load(self, unlink: bool = False) -> Image.Image:
+        """
+        Copy image from shared memory.
+
+        The copy is private, so it can be modified
+        without affecting other processes.
+
+        :param unlink: free the memory block after copying.
+        :return: image.
+        """
+        shm = SharedMemory(name=self.name)
+        try:
+            return Image.frombytes(self.mode, self.size, cast(memoryview, shm.buf))
+        finally:
+            shm.close()
+            if unlink:
+                shm.unlink()
+
+    def unlink(self) -> None:
+        """Free the memory block."""
+        shm = SharedMemory(name=self.name)
+        shm.close()
+        shm.unlink()
+
+
+class LayerPool:
+    """
+    Long-lived pool of layer workers.
+
+    Workers are forked on the first use
+    and reused for every following render,
+    until the pool is closed.
+
+    Pool with zero processes processes layers
+    in the calling process.
+    """
+
+    def __init__(self, processes: int | None = None) -> None:
+        self.processes = processes
+        self._pool: Pool | None = None
+
+    @property
+    def in_process(self) -> bool:
+        """Whether layers are processed in the calling process."""
+        return self.processes == 0
+
+    @property
+    def started(self) -> bool:
+        """Whether workers are running."""
+        return self._pool is not None
+
+    def start(self) -> None:
+        """Fork worker processes if they're not running."""
+        if not self.in_process:
+            self._get_pool()
+
+    def map(self, func: Callable[[Any], _T], iterable: Iterable[Any]) -> List[_T]:
+        """
+        Apply function to every item in parallel.
+
+        :param func: function to call in workers.
+        :param iterable: function arguments.
+        :return: list of results in the same order.
+        """
+        if self.in_process:
+            return list(map(func, iterable))
+        pool = self._get_pool()
+        start = time.perf_counter()
+        results = pool.map(func, iterable)
+        logger.debug(f"Pool map finished in {time.perf_counter() - start:.3f}s")
+        return results
+
+    def _get_pool(self) -> Pool:
+        if self._pool is None:
+            start = time.perf_counter()
+            # Workers should share the tracker of shared memory blocks
+            # with the daemon, so blocks created by workers and freed
+            # by the daemon aren't reported as leaked.
+            resource_tracker.ensure_running()
+            self._pool = Pool(processes=self.processes)
+            logger.debug(
+                f"Started {self.processes or os.cpu_count()} layer workers "
+                f"in {time.perf_counter() - start:.3f}s",
+            )
+        return self._pool
+
+    def close(self) -> None:
+        """Gracefully stop all workers."""
+        if self._pool is None:
+            return
+        logger.debug("Shutting down layer workers")
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
@@ -0,0 +1,557 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+import threading
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+from loguru import logger
+from PIL import Image
+
+from music_bg.background import reset_background, set_background
+from music_bg.cache import render_key
+from music_bg.context import Context, Metadata, Screen
+from music_bg.decode import (
+    decode_cover,
+    decode_full,
+    decode_thumbnail,
+    reads_cover,
+)
+from music_bg.img_processors.processor import process_images
+from music_bg.output import save_image
+from music_bg.utils import cpu_load, on_battery
+
+# How often to check if prerendering can be resumed, in seconds.
+PREFETCH_RETRY_INTERVAL = 30
+
+
+@dataclass
+class RenderRequest:
+    """
+    Request for a background update.
+
+    If metadata is None, background is reset,
+    unless caches are flushed.
+    """
+
+    generation: int
+    metadata: Optional[Metadata] = None
+    # Render into the cache without setting a background.
+    prefetch: bool = False
+    # Clear the render cache and export metrics.
+    flush: bool = False
+
+
+def render_track(
+    context: Context,
+    metadata: Metadata,
+    is_stale: Callable[[], bool],
+    apply: bool = True,
+) -> None:
+    """
+    Render album cover of a track and set it as a background.
+
+    Rendering is stopped between stages
+    as soon as the request becomes stale.
+    Wallpapers of all screens from `Context.render_screens`
+    are rendered at once.
+
+    :param context: current mbg context.
+    :param metadata: metadata of a track to render.
+    :param is_stale: function that tells if a newer request was submitted.
+    :param apply: set rendered wallpaper as a background,
+        otherwise it's only stored in the render cache.
+    """
+    if not metadata.art_url:
+        logger.warning("No art url")
+        return
+
+    metrics = context.metrics
+    logger.debug(f"Requesting {metadata.art_url}")
+    with metrics.span("download"):
+        art = context.art_fetcher.fetch(metadata.art_url)
+    if art is None or is_stale():
+        return
+
+    context.refresh()
+
+    screens = context.render_screens()
+    image = _decode(context, art, metadata, screens)
+    keys = [render_key(image, context, screen) for screen in screens]
+    paths = [context.render_cache.get(key) for key in keys]
+    missing = [index for index, path in enumerate(paths) if path is None]
+    if missing and apply and context.config.progressive.enabled:
+        _show_preview(context, image, screens, paths, is_stale)
+        if is_stale():
+            return
+    if missing:
+        rendered = _render_screens(
+            context,
+            image,
+            [screens[index] for index in missing],
+            is_stale,
+        )
+        if rendered is None:
+            return
+        for index, wallpaper in zip(missing, rendered, strict=True):
+            if apply and index == 0:
+                context.previous_image = wallpaper
+            paths[index] = _store(
+                context,
+                wallpaper,
+                screens[index],
+                keys[index],
+                apply=apply,
+            )
+    else:
+        logger.debug(f"Using cached background {paths[0]}")
+    if not apply or is_stale():
+        return
+    _apply(
+        context,
+        screens,
+        [
+            _publish(context, screen, path)
+            for screen, path in zip(screens, paths, strict=True)
+        ],
+    )
+
+
+def _decode(
+    context: Context,
+    art: bytes,
+    metadata: Metadata,
+    screens: List[Screen],
+) -> Image.Image:
+    """
+    Decode album cover and compute variables.
+
+    :param context: current mbg context.
+    :param art: encoded album cover.
+    :param metadata: metadata of a track to render.
+    :param screens: screens to render.
+    :return: cover decoded at the scale layers need.
+    """
+    metrics = context.metrics
+    with metrics.span("decode_thumbnail"):
+        thumbnail = decode_thumbnail(art)
+    context.thumbnail = thumbnail
+    image = None
+    if reads_cover(context):
+        with metrics.span("decode"):
+            image = decode_full(art, thumbnail)
+    context.src_image = image
+    with metrics.span("variables"):
+        context.update_variables()
+        # Player may have already switched to another track.
+        context.variables["metadata"] = metadata
+    if image is None:
+        with metrics.span("decode"):
+            image = decode_cover(art, context, screens, thumbnail)
+        context.src_image = image
+    return image
+
+
+def _show_preview(
+    context: Context,
+    image: Image.Image,
+    screens: List[Screen],
+    paths: List[Optional[Path]],
+    is_stale: Callable[[], bool],
+) -> None:
+    """
+    Render low resolution wallpapers and set them as a background.
+
+    Cached wallpapers are used as is. Errors are only logged,
+    since the full render may still succeed.
+
+    :param context: current mbg context.
+    :param image: decoded album cover.
+    :param screens: screens to render.
+    :param paths: cached wallpapers of screens.
+    :param is_stale: function that tells if a newer request was submitted.
+    """
+    missing = [index for index, path in enumerate(paths) if path is None]
+    try:
+        previews = _render_screens(
+            context,
+            image,
+            [screens[index] for index in missing],
+            is_stale,
+            preview=True,
+        )
+    except Exception as exc:
+        logger.warning(f"Can't render preview: {exc}")
+        return
+    if previews is None:
+        return
+    preview_paths = list(paths)
+    for index, preview in zip(missing, previews, strict=True):
+        preview_paths[index] = _save(
+            context,
+            preview,
+            _output_path(screens[index], context, "music_bg-preview"),
+        )
+    _apply(context, screens, preview_paths)
+
+
+def _render_screens(
+    context: Context,
+    image: Image.Image,
+    screens: List[Screen],
+    is_stale: Callable[[], bool],
+    preview: bool = False,
+) -> Optional[List[Image.Image]]:
+    """
+    Render wallpapers for screens.
+
+    :param context: current mbg context.
+    :param image: decoded album cover.
+    :param screens: screens to render.
+    :param is_stale: function that tells if a newer request was submitted.
+    :param preview: render a low resolution preview.
+    :return: wallpapers or None if request is stale.
+    """
+    scale = context.config.progressive.scale if preview else 1
+    with context.metrics.span("preview" if preview else "layers"):
+        processed = process_images(image, context, screens, scale)
+    if not processed or is_stale():
+        return None
+    return processed
+
+
+def _store(
+    context: Context,
+    wallpaper: Image.Image,
+    screen: Screen,
+    key: str,
+    *,
+    apply: bool,
+) -> Optional[Path]:
+    """
+    Save rendered wallpaper and put it into the render cache.
+
+    Wallpapers of upcoming tracks are saved to private files,
+    so the wallpaper of the current track is never overwritten.
+
+    :param context: current mbg context.
+    :param wallpaper: rendered wallpaper.
+    :param screen: screen wallpaper was rendered for.
+    :param key: render cache key of the wallpaper.
+    :param apply: wallpaper is going to be set as a background.
+    :return: path to the wallpaper to set or None for prerenders.
+    """
+    if apply:
+        path = _save(context, wallpaper, _output_path(screen, context, "music_bg"))
+        context.render_cache.put(key, path)
+        return path
+    if context.render_cache.enabled:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            suffix = context.config.output.suffix
+            path = _save(context, wallpaper, Path(tmp_dir) / f"wallpaper{suffix}")
+            context.render_cache.put(key, path)
+    return None
+
+
+def _output_path(screen: Screen, context: Context, name: str) -> Path:
+    """
+    Get path to save rendered wallpaper to.
+
+    :param screen: screen wallpaper was rendered for.
+    :param context: current mbg context.
+    :param name: base name of the file.
+    :return: path in temporary directory.
+    """
+    suffix = context.config.output.suffix
+    if screen == context.screen:
+        return Path(tempfile.gettempdir()) / f"{name}{suffix}"
+    return (
+        Path(tempfile.gettempdir()) / f"{name}-{screen.width}x{screen.height}{suffix}"
+    )
+
+
+def _publish(context: Context, screen: Screen, path: Optional[Path]) -> Optional[Path]:
+    """
+    Copy cached wallpaper to the output path.
+
+    Cache entries may be evicted while they are
+    still shown, so the background is always
+    set from the stable output path.
+
+    :param context: current mbg context.
+    :param screen: screen wallpaper was rendered for.
+    :param path: path to the wallpaper.
+    :return: output path of the wallpaper.
+    """
+    output = _output_path(screen, context, "music_bg")
+    if path is None or path == output:
+        return path
+    tmp_path = output.with_name(f"{output.name}.tmp")
+    shutil.copyfile(path, tmp_path)
+    tmp_path.replace(output)
+    return output
+
+
+def _save(context: Context, wallpaper: Image.Image, path: Path) -> Path:
+    """
+    Encode wallpaper in the configured format.
+
+    :param context: current mbg context.
+    :param wallpaper: rendered wallpaper.
+    :param path: path to save to.
+    :return: path to the saved file.
+    """
+    with context.metrics.span("save"), path.open(mode="w+b") as out_file:
+        save_image(wallpaper, out_file, context.config.output)
+    logger.debug(f"Background saved at {path}")
+    return path
+
+
+def _apply(
+    context: Context,
+    screens: List[Screen],
+    paths: Sequence[Optional[Path]],
+) -> None:
+    """
+    Set rendered wallpapers as a background.
+
+    :param context: current mbg context.
+    :param screens: rendered screens, the biggest one goes first.
+    :param paths: wallpapers of the screens.
+    """
+    by_size = {
+        (screen.width, screen.height): str(path)
+        for screen, path in zip(screens, paths, strict=True)
+    }
+    outputs = {
+        monitor.name: by_size.get((monitor.width, monitor.height), str(paths[0]))
+        for monitor in context.monitors
+    }
+    with context.metrics.span("set_command"):
+        set_background(str(paths[0]), context, outputs)
+
+
+def _describe(request: Optional[RenderRequest]) -> Optional[Dict[str, Any]]:
+    if request is None:
+        return None
+    return {
+        "track": request.metadata and request.metadata.art_url,
+        "reset": request.metadata is None and not request.flush,
+        "prefetch": request.prefetch,
+        "flush": request.flush,
+    }
+
+
+class Renderer:
+    """
+    Background renderer.
+
+    Renders are performed in a separate thread,
+    so D-Bus loop is never blocked.
+
+    Only the latest request is kept. If a new request
+    is submitted while a render is in progress,
+    the current render is abandoned at the next stage
+    and its result is never set as a background.
+
+    When there are no requests, upcoming tracks are
+    prerendered into the render cache, unless the system
+    is busy or running on battery.
+    """
+
+    def __init__(self, context: Context) -> None:
+        self.context = context
+        self._condition = threading.Condition()
+        self._pending: Optional[RenderRequest] = None
+        self._prefetch: Deque[Metadata] = deque()
+        self._generation = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[RenderRequest] = None
+        self._flush = False
+
+    def start(self) -> None:
+        """Start rendering thread."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            name="music_bg-renderer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Abandon all requests and wait for rendering thread to exit."""
+        with self._condition:
+            self._running = False
+            self._generation += 1
+            self._pending = None
+            self._flush = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, metadata: Optional[Metadata]) -> None:
+        """
+        Request a background update.
+
+        This request supersedes all previous ones.
+
+        :param metadata: track to render, or None to reset background.
+        """
+        with self._condition:
+            self._generation += 1
+            if self._pending is not None:
+                logger.debug("Dropping outdated render request")
+            self._pending = RenderRequest(self._generation, metadata)
+            self._condition.notify()
+
+    def prefetch(self, tracks: List[Metadata]) -> None:
+        """
+        Queue upcoming tracks for prerendering.
+
+        Previously queued tracks are dropped.
+
+        :param tracks: tracks in the order they will be played.
+        """
+        with self._condition:
+            self._prefetch = deque(tracks)
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """
+        Drop prerendered tracks and cached wallpapers, export metrics.
+
+        The cache is cleared by the rendering thread,
+        so wallpapers are never removed while they're written.
+        """
+        with self._condition:
+            self._prefetch.clear()
+            self._flush = True
+            self._condition.notify()
+
+    def is_stale(self, request: RenderRequest) -> bool:
+        """
+        Check whether a newer request was submitted.
+
+        :param request: request to check.
+        :return: True if request is outdated.
+        """
+        with self._condition:
+            stale = request.generation != self._generation
+        if stale:
+            logger.debug("Render request was superseded")
+        return stale
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Get state of the render queue.
+
+        Tracks are described by their art urls,
+        reset requests by None.
+
+        :return: pending, in-flight and prerendered requests.
+        """
+        with self._condition:
+            return {
+                "running": self._running,
+                "pending": _describe(self._pending),
+                "in_flight": _describe(self._current),
+                "prefetch_queue": [track.art_url for track in self._prefetch],
+            }
+
+    def _can_prefetch(self) -> bool:
+        config = self.context.config.prefetch
+        if not config.enabled or not self.context.render_cache.enabled:
+            self._prefetch.clear()
+            return False
+        if not config.on_battery and on_battery():
+            logger.debug("Prerendering is paused while on battery")
+            return False
+        load = cpu_load()
+        if load > config.max_load:
+            logger.debug(f"Prerendering is paused, CPU load is {load:.2f}")
+            return False
+        return True
+
+    def _next_request(self) -> Optional[RenderRequest]:
+        with self._condition:
+            while self._running:
+                if self._flush:
+                    self._flush = False
+                    return RenderRequest(self._generation, flush=True)
+                if self._pending is not None:
+                    request = self._pending
+                    self._pending = None
+                    return request
+                if self._prefetch and self._can_prefetch():
+                    return RenderRequest(
+                        self._generation,
+                        self._prefetch.popleft(),
+                        prefetch=True,
+                    )
+                self._condition.wait(
+                    PREFETCH_RETRY_INTERVAL if self._prefetch else None,
+                )
+            return None
+
+    def _run(self) -> None:
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            with self._condition:
+                self._current = request
+            try:
+                self._process(request)
+            except Exception as exc:
+                logger.exception(exc)
+            finally:
+                with self._condition:
+                    self._current = None
+
+    def _process(self, request: RenderRequest) -> None:
+        if request.flush:
+            self._flush_caches()
+            return
+        if request.metadata is None:
+            if not self.is_stale(request):
+                reset_background(self.context)
+            return
+        if request.prefetch:
+            logger.debug(f"Prerendering {request.metadata.art_url}")
+            with self.context.metrics.span("prefetch"):
+                render_track(
+                    self.context,
+                    request.metadata,
+                    lambda: self.is_stale(request),
+                    apply=False,
+                )
+            return
+        with self.context.metrics.span("render"):
+            render_track(
+                self.context,
+                request.metadata,
+                lambda: self.is_stale(request),
+            )
+        self.context.metrics.flush(
+            self.context.config.metrics.path,
+            self.context.log_timings,
+        )
+
+    def _flush_caches(self) -> None:
+        try:
+            self.context.render_cache.clear()
+        except OSError as exc:
+            logger.warning(f"Can't clear render cache: {exc}")
+        self.context.metrics.flush(
+            self.context.config.metrics.path,
+            self.context.log_timings,
+        )
@@ -1,10 +1,12 @@
 import os
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Tuple
+from string import Formatter
+from typing import Iterator, Set, Tuple
 
-import numpy as np
+from loguru import logger
 from PIL import Image
-from sklearn.cluster import KMeans
 
 
 def xdg_config_home() -> Path:
@@ -19,6 +21,129 @@ def xdg_config_home() -> Path:
     return Path(config_home)
 
 
+def xdg_cache_home() -> Path:
+    """
+    Return a Path corresponding to XDG_CACHE_HOME.
+
+    :return: xdg_cache_home path.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        return Path.home() / ".cache"
+    return Path(cache_home)
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """
+    Parse image size.
+
+    :param size: size in format WIDTHxHEIGHT.
+    :raises ValueError: if string has unknown format.
+    :return: width and height.
+    """
+    width, sep, height = size.lower().partition("x")
+    if not sep or not width.isdigit() or not height.isdigit():
+        raise ValueError(f"Badly formatted size: '{size}'")
+    return int(width), int(height)
+
+
+def template_variables(template: str) -> Set[str]:
+    """
+    Find names of top-level variables used in a format string.
+
+    For template "{screen.width}x{screen.height} {colors[0]}"
+    it returns {"screen", "colors"}.
+
+    :param template: format string.
+    :return: set of variable names.
+    """
+    names = set()
+    for _, field_name, format_spec, _ in Formatter().parse(template):
+        if field_name is None:
+            continue
+        names.add(field_name.split(".", 1)[0].split("[", 1)[0])
+        if format_spec:
+            names.update(template_variables(format_spec))
+    return names
+
+
+def cpu_load() -> float:
+    """
+    Get one-minute load average per CPU.
+
+    :return: load average divided by the number of CPUs.
+    """
+    try:
+        load, _, _ = os.getloadavg()
+    except OSError:
+        return 0
+    return load / (os.cpu_count() or 1)
+
+
+def on_battery() -> bool:
+    """
+    Check whether the computer is running on battery.
+
+    :return: True if no AC adapter is online and a battery is discharging.
+    """
+    supplies = Path("/sys/class/power_supply")
+    if not supplies.is_dir():
+        return False
+    discharging = False
+    for supply in supplies.iterdir():
+        try:
+            supply_type = (supply / "type").read_text().strip()
+            if (
+                supply_type == "Mains"
+                and (supply / "online").read_text().strip() == "1"
+            ):
+                return False
+            if supply_type == "Battery":
+                status = (supply / "status").read_text().strip()
+                discharging = discharging or status == "Discharging"
+        except OSError:
+            continue
+    return discharging
+
+
+@contextmanager
+def log_duration(action: str) -> Iterator[None]:
+    """
+    Log how long the block of code took.
+
+    :param action: description of an action for logs.
+    :yield: nothing.
+    """
+    start = time.perf_counter()
+    yield
+    logger.debug(f"{action} took {time.perf_counter() - start:.3f}s")
+
+
+def is_opaque(image: Image.Image) -> bool:
+    """
+    Check whether image has no transparent pixels.
+
+    :param image: RGBA image or image without alpha channel.
+    :return: True if all pixels are fully opaque.
+    """
+    if image.mode != "RGBA":
+        return True
+    # Most of translucent layers are rejected by a few pixels
+    # without scanning the whole alpha channel.
+    right, bottom = image.width - 1, image.height - 1
+    for xy in (
+        (0, 0),
+        (right, 0),
+        (0, bottom),
+        (right, bottom),
+        (right // 2, bottom // 2),
+    ):
+        if image.getpixel(xy)[3] != 255:  # type: ignore[index]
+            return False
+    min_alpha, _ = image.getchannel("A").getextrema()
+    return bool(min_alpha == 255)
+
+
 def most_frequent_color(
     image: Image.Image,
 ) -> Tuple[int, int, int]:
@@ -43,23 +168,6 @@ def most_frequent_color(
     return tuple(dominant_color)
 
 
-def get_accent_colors(
-    image: Image.Image,
-    num_colors: int = 5,
-) -> list[Tuple[int, int, int]]:
-    """Get accent colors."""
-    image.thumbnail((100, 100))
-    image = image.convert("RGB")
-
-    img_np = np.array(image).reshape((-1, 3))
-    kmeans = KMeans(n_clusters=num_colors, init="k-means++", n_init=10, random_state=42)
-    kmeans.fit(img_np)
-
-    accent_colors = kmeans.cluster_centers_.astype(int)
-
-    return [tuple(color) for color in accent_colors]
-
-
 def luminance(color: Tuple[int, int, int]) -> float:
     """
     Calculate the luminance of a color.
@@ -91,30 +199,6 @@ def contrast_ratio(
     return (lighter + 0.05) / (darker + 0.05)
 
 
-def get_contrasting_accent_colors(
-    image: Image.Image,
-    min_contrast_ratio: float = 5.5,
-    num_colors: int = 5,
-) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
-    """
-    Get accent colors from the image that have sufficient contrast score.
-
-    :param image: input image.
-    :param background_color: background color tuple (red, green, blue).
-    :param min_contrast_ratio: minimum contrast ratio required.
-    :param num_colors: number of accent colors to extract.
-    :return: list of accent colors with sufficient contrast.
-    """
-    accent_colors = get_accent_colors(image, num_colors)
-    fg = accent_colors[0]
-    bg = (255 - fg[0], 255 - fg[1], 255 - fg[1])  # Default to inversed fg
-    for color in accent_colors[1:]:
-        if contrast_ratio(color, fg) >= min_contrast_ratio:
-            bg = color
-            break
-    return (bg, fg)
-
-
 def colorstr_to_tuple(color: str) -> Tuple[int, int, int]:
     """
     Convert color hex to tuple of ints.
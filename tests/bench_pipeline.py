@@ -0,0 +1,71 @@
+"""
+Benchmarks of processors and the render pipeline.
+
+They aren't collected with other tests, run them with
+`pytest tests/bench_pipeline.py`. All options of pytest-benchmark,
+like `--benchmark-compare`, can be used to track regressions.
+Peak memory of the last round is saved in `extra_info`.
+"""
+
+from importlib.metadata import entry_points
+
+import pytest
+from PIL import Image
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from music_bg.bench import bench_pipeline, bench_processor
+from music_bg.context import Context
+from tests.conftest import ContextFactory
+
+PROCESSORS = sorted(entry.name for entry in entry_points(group="mbg_processors"))
+
+LAYERS = [
+    {
+        "name": "background",
+        "processors": [
+            {
+                "name": "fit",
+                "args": {"width": "{screen.width}", "height": "{screen.height}"},
+            },
+            {"name": "gaussian_blur", "args": {"radius": 20}},
+        ],
+    },
+    {
+        "name": "cover",
+        "processors": [
+            {"name": "fit", "args": {"width": 500, "height": 500}},
+            {"name": "circle"},
+        ],
+    },
+]
+
+
+@pytest.fixture
+def context(make_context: ContextFactory, cover: Image.Image) -> Context:
+    context = make_context(LAYERS, render_cache={"enabled": False})
+    context.src_image = cover.copy()
+    context.update_variables()
+    return context
+
+
+@pytest.mark.parametrize("name", PROCESSORS)
+def test_processor(
+    benchmark: BenchmarkFixture,
+    context: Context,
+    cover: Image.Image,
+    name: str,
+) -> None:
+    result = benchmark(bench_processor, context, name, cover, 1)
+    if result.skipped:
+        pytest.skip(result.skipped)
+    benchmark.extra_info["memory_mb"] = result.memory_mb
+
+
+def test_pipeline(
+    benchmark: BenchmarkFixture,
+    context: Context,
+    cover_bytes: bytes,
+) -> None:
+    results = benchmark(bench_pipeline, context, cover_bytes, 1)
+    assert all(result.samples for result in results)
+    benchmark.extra_info["memory_mb"] = results[-1].memory_mb
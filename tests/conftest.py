@@ -0,0 +1,143 @@
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+import pytest
+import screeninfo
+from PIL import Image
+
+from music_bg.bench import synthetic_cover
+from music_bg.context import Context
+
+ContextFactory = Callable[..., Context]
+RunUntil = Callable[[Callable[[], bool]], None]
+
+
+class FakeMonitor:
+    def __init__(self, width: int, height: int, name: str) -> None:
+        self.width = width
+        self.height = height
+        self.name = name
+
+
+@pytest.fixture(autouse=True)
+def monitors(monkeypatch: pytest.MonkeyPatch) -> List[FakeMonitor]:
+    """Connected monitors, tests can change them."""
+    connected = [FakeMonitor(1920, 1080, "HDMI-1")]
+    monkeypatch.setattr(screeninfo, "get_monitors", lambda: connected)
+    return connected
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep caches of tests out of the user's cache."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep wallpapers of tests away from the ones the daemon sets."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def cover_bytes() -> bytes:
+    return synthetic_cover(400)
+
+
+@pytest.fixture
+def cover(cover_bytes: bytes) -> Image.Image:
+    return Image.open(BytesIO(cover_bytes)).convert("RGBA")
+
+
+@pytest.fixture
+def make_context(tmp_path: Path) -> Iterator[ContextFactory]:
+    """
+    Create contexts with given layers and config options.
+
+    Config is written to a temporary file,
+    pools of created contexts are closed after the test.
+    """
+    contexts: List[Context] = []
+
+    def factory(layers: List[Dict[str, Any]], **options: Any) -> Context:
+        config_path = tmp_path / f"config{len(contexts)}.json"
+        options.setdefault("set_command", "true")
+        options.setdefault("reset_command", "true")
+        config_path.write_text(json.dumps({"layers": layers, **options}))
+        context = Context(config_path)
+        contexts.append(context)
+        return context
+
+    yield factory
+    for context in contexts:
+        context.pool.close()
+
+
+@pytest.fixture
+def bus_address() -> Iterator[str]:
+    """Address of a private session bus, so tests never touch the user's one."""
+    pytest.importorskip("dbus")
+    pytest.importorskip("gi")
+    daemon = shutil.which("dbus-daemon")
+    if daemon is None:
+        pytest.skip("dbus-daemon is not installed")
+    process = subprocess.Popen(  # noqa: S603
+        [daemon, "--session", "--print-address", "--nofork"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert process.stdout is not None
+    address = process.stdout.readline().strip()
+    yield address
+    process.terminate()
+    process.wait()
+    process.stdout.close()
+
+
+@pytest.fixture
+def connect_bus(bus_address: str) -> Iterator[Callable[[], Any]]:
+    """
+    Open connections to the private session bus.
+
+    Connections are dispatched by the default GLib loop,
+    like the daemon's one, and closed after the test.
+    """
+    from dbus.bus import BusConnection  # noqa: PLC0415
+    from dbus.mainloop.glib import DBusGMainLoop  # noqa: PLC0415
+
+    connections: List[Any] = []
+
+    def connect() -> Any:
+        connection = BusConnection(bus_address, mainloop=DBusGMainLoop())
+        connections.append(connection)
+        return connection
+
+    yield connect
+    for connection in connections:
+        connection.close()
+
+
+@pytest.fixture
+def run_until() -> RunUntil:
+    """Run the GLib loop until a condition is met."""
+    from gi.repository import GLib  # noqa: PLC0415
+
+    def run(condition: Callable[[], bool], timeout: float = 5) -> None:
+        loop_context = GLib.MainContext.default()
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                pytest.fail("Condition wasn't met in time")
+            if not loop_context.iteration(False):
+                time.sleep(0.01)
+
+    return run
@@ -0,0 +1,104 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+from music_bg.dbus.art import ArtCache, ArtFetcher
+
+COVER = b"not really a jpeg"
+ETAG = '"v1"'
+
+
+class ArtServer(ThreadingHTTPServer):
+    """Local stand-in for a cover server with ETag validation."""
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), ArtHandler)
+        self.requests: List[Dict[str, Any]] = []
+        self.connections = 0
+
+    def url(self, path: str) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}{path}"
+
+
+class ArtHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ArtServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self) -> None:
+        self.server.requests.append(
+            {"path": self.path, "etag": self.headers.get("If-None-Match")},
+        )
+        if self.path != "/cover.jpg":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(COVER)))
+        self.end_headers()
+        self.wfile.write(COVER)
+
+    def log_message(self, *_args: Any) -> None:
+        """Keep test output clean."""
+
+
+@pytest.fixture
+def server() -> Iterator[ArtServer]:
+    art_server = ArtServer()
+    thread = threading.Thread(target=art_server.serve_forever, daemon=True)
+    thread.start()
+    yield art_server
+    art_server.shutdown()
+    art_server.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path: Path) -> Iterator[ArtFetcher]:
+    art_fetcher = ArtFetcher(
+        ArtCache(directory=tmp_path / "art", max_entries=10, max_size=1024 * 1024),
+        timeout=1,
+    )
+    yield art_fetcher
+    art_fetcher.close()
+
+
+def test_cover_is_revalidated(server: ArtServer, fetcher: ArtFetcher) -> None:
+    url = server.url("/cover.jpg")
+
+    assert fetcher.fetch(url) == COVER
+    assert fetcher.fetch(url) == COVER
+
+    assert [request["etag"] for request in server.requests] == [None, ETAG]
+    assert (fetcher.hits, fetcher.misses) == (1, 1)
+    # The connection is kept alive between covers.
+    assert server.connections == 1
+
+
+def test_cover_is_served_offline(server: ArtServer, fetcher: ArtFetcher) -> None:
+    url = server.url("/cover.jpg")
+    assert fetcher.fetch(url) == COVER
+    server.shutdown()
+    server.server_close()
+    fetcher.session.close()
+
+    assert fetcher.fetch(url) == COVER
+    assert fetcher.hits == 1
+
+
+def test_missing_cover(server: ArtServer, fetcher: ArtFetcher) -> None:
+    assert fetcher.fetch(server.url("/missing.jpg")) is None
+    assert fetcher.cache.entries() == []
@@ -0,0 +1,79 @@
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pytest
+
+from music_bg import batch
+from music_bg.batch import BatchIndex, render_cover, run_batch
+from music_bg.bench import synthetic_cover
+from music_bg.context import Context, Screen
+from tests.conftest import ContextFactory
+
+SCREENS = [Screen(width=64, height=36)]
+
+
+@pytest.fixture
+def covers(tmp_path: Path) -> Path:
+    directory = tmp_path / "covers"
+    directory.mkdir()
+    for seed, name in enumerate(("first.jpg", "broken.jpg")):
+        (directory / name).write_bytes(synthetic_cover(100, seed=seed))
+    return directory
+
+
+@pytest.fixture
+def context(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Context:
+    """Context of a batch which renders covers in the test process."""
+    context = make_context(
+        [
+            {
+                "name": "cover",
+                "processors": [{"name": "fit", "args": {"width": 64, "height": 36}}],
+            },
+        ],
+    )
+
+    def iter_results(
+        context: Context,
+        jobs: List[Tuple[Path, str]],
+        screens: List[Screen],
+        output_dir: Optional[Path],
+        _workers: int,
+    ) -> Iterator[batch.CoverResult]:
+        batch._init_worker(context)
+        for job in jobs:
+            yield render_cover(job, screens, output_dir)
+
+    render = batch._render_cover
+
+    def render_or_fail(context: Context, result: Any, *args: Any) -> None:
+        if result.path.name == "broken.jpg":
+            raise ZeroDivisionError("division by zero")
+        render(context, result, *args)
+
+    monkeypatch.setattr(batch, "_iter_results", iter_results)
+    monkeypatch.setattr(batch, "_render_cover", render_or_fail)
+    return context
+
+
+def test_failed_cover_doesnt_stop_batch(
+    tmp_path: Path,
+    covers: Path,
+    context: Context,
+) -> None:
+    output_dir = tmp_path / "out"
+
+    summary = run_batch(context, [str(covers)], SCREENS, output_dir)
+
+    assert (summary.rendered, summary.failed) == (1, 1)
+    index = BatchIndex(output_dir / batch.INDEX_NAME)
+    index.load()
+    assert len(index.done) == 1
+    assert list(index.failed.values()) == ["ZeroDivisionError: division by zero"]
+
+    # Only the failed cover is rendered again.
+    summary = run_batch(context, [str(covers)], SCREENS, output_dir)
+    assert (summary.skipped, summary.failed) == (1, 1)
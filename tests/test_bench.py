@@ -0,0 +1,34 @@
+from music_bg.bench import BenchResult, format_results, track_memory
+
+MB = 1024 * 1024
+
+
+def allocate(size: int) -> None:
+    block = bytearray(size)
+    # Touch every page, so it's resident.
+    block[::4096] = b"\x01" * len(block[::4096])
+
+
+def test_memory_is_measured_per_benchmark() -> None:
+    large = BenchResult(name="large", screen="1x1")
+    small = BenchResult(name="small", screen="1x1")
+
+    with track_memory(large):
+        allocate(64 * MB)
+    with track_memory(small):
+        allocate(MB)
+
+    assert large.memory_mb is not None
+    assert small.memory_mb is not None
+    assert large.memory_mb > 32
+    # The peak of the large benchmark isn't reported again.
+    assert small.memory_mb < 16
+
+
+def test_memory_is_reported_next_to_timings() -> None:
+    result = BenchResult(name="large", screen="1x1", samples=[0.01])
+    result.memory_mb = 12.5
+
+    table = format_results([result])
+
+    assert table.splitlines()[-1].split()[-1] == "12.5"
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from PIL import Image
+
+from music_bg.img_variables.colors import colors_var
+from music_bg.utils import colorstr_to_tuple, contrast_ratio
+from tests.conftest import ContextFactory
+
+WIKI_IMAGES = Path(__file__).parent.parent / "images" / "wiki"
+
+
+def test_accent_colors_contrast(make_context: ContextFactory) -> None:
+    context = make_context([])
+    context.src_image = Image.open(WIKI_IMAGES / "config3.png").convert("RGBA")
+
+    colors = colors_var(context)
+
+    assert colors.second_accent_color == "#191919"
+    assert (
+        contrast_ratio(
+            colorstr_to_tuple(colors.accent_color),
+            colorstr_to_tuple(colors.second_accent_color),
+        )
+        >= 4
+    )
+
+
+def test_least_frequent_color_keeps_default(make_context: ContextFactory) -> None:
+    context = make_context([])
+    context.src_image = Image.open(WIKI_IMAGES / "config3.png").convert("RGBA")
+
+    colors = colors_var(context)
+
+    # It has never been computed, configs get the same color for every cover.
+    assert colors.least_frequent_color == "#000000"
+    assert colors.least_frequent_color_inverted == "#FFFFFF"
@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from music_bg.config import Config
+from music_bg.dbus.handlers import reload_signal_handler
+from tests.conftest import ContextFactory, FakeMonitor
+
+
+def test_sighup_reloads_before_next_render(
+    make_context: ContextFactory,
+    monitors: List[FakeMonitor],
+) -> None:
+    context = make_context([], workers=1)
+    monitors.append(FakeMonitor(2560, 1440, "DP-1"))
+    config = json.loads(context.config_path.read_text())
+    context.config_path.write_text(json.dumps({**config, "workers": 2}))
+
+    # The handler runs in the D-Bus loop, where the context
+    # may be in use by the renderer, so nothing is changed yet.
+    assert reload_signal_handler(context)()
+    assert context.screen.width == 1920
+    assert context.config.workers == 1
+
+    context.refresh()
+
+    assert context.screen.width == 2560
+    assert context.config.workers == 2
+    assert not context.reload_requested
+
+
+def test_sighup_reloads_unchanged_config(
+    make_context: ContextFactory,
+    monitors: List[FakeMonitor],
+) -> None:
+    context = make_context([])
+    monitors[:] = [FakeMonitor(1280, 720, "eDP-1")]
+
+    context.refresh()
+    assert context.screen.width == 1920
+
+    reload_signal_handler(context)()
+    context.refresh()
+    assert context.screen.width == 1280
+    assert [monitor.name for monitor in context.monitors] == ["eDP-1"]
+
+
+def test_refresh_keeps_config_if_file_is_gone(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    context = make_context([], workers=1)
+
+    def from_file(config_path: Path) -> Config:
+        raise FileNotFoundError(config_path)
+
+    # The file disappears after its mtime is checked.
+    monkeypatch.setattr(Config, "from_file", from_file)
+    context.reload_requested = True
+    context.refresh()
+
+    assert context.config.workers == 1
+
+
+def test_refresh_applies_settings(make_context: ContextFactory) -> None:
+    context = make_context([], workers=1)
+    old_pool = context.pool
+    context.render_cache.put_bytes("first", b"png")
+    context.render_cache.put_bytes("second", b"png")
+    context.metrics.record("render", 1)
+    context.metrics.record("render", 2)
+    config = json.loads(context.config_path.read_text())
+    context.config_path.write_text(
+        json.dumps(
+            {
+                **config,
+                "workers": 0,
+                "render_cache": {"max_entries": 1},
+                "art_cache": {"enabled": False},
+                "metrics": {"window": 1},
+            },
+        ),
+    )
+
+    context.reload_requested = True
+    context.refresh()
+
+    assert context.pool is not old_pool
+    assert context.pool.in_process
+    assert len(context.render_cache.entries()) == 1
+    assert not context.art_fetcher.cache.enabled
+    assert context.metrics.summary()["render"]["count"] == 2
+    assert list(context.metrics._samples["render"]) == [2]
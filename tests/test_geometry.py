@@ -0,0 +1,119 @@
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from music_bg.img_processors import geometry
+from music_bg.img_processors.geometry import (
+    Step,
+    apply_steps,
+    fuse_geometry,
+    transform,
+)
+from music_bg.img_processors.plan import build_plan
+from tests.conftest import ContextFactory
+
+
+def fit(width: int, height: int) -> Step:
+    return ("fit", (("width", width), ("height", height)))
+
+
+def resize(**args: object) -> Step:
+    return ("resize", tuple(args.items()))
+
+
+def diff(first: Image.Image, second: Image.Image) -> np.ndarray:
+    assert first.size == second.size
+    result: np.ndarray = np.abs(np.asarray(first, int) - np.asarray(second, int))
+    return result
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        (fit(1920, 1080),),
+        (fit(300, 300),),
+        (fit(300, 200),),
+        (resize(width=200, height=100),),
+    ],
+)
+def test_single_step_matches(cover: Image.Image, steps: Tuple[Step, ...]) -> None:
+    # Only rounding at edges of a cropped region may differ.
+    assert diff(transform(cover, steps), apply_steps(cover, steps)).max() <= 1
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        (fit(1920, 1080), resize(width=500, height=500)),
+        (resize(factor=0.5), resize(factor=0.5)),
+        (fit(800, 450), resize(width=400, height=225), fit(200, 200)),
+    ],
+)
+def test_chain_is_close(cover: Image.Image, steps: Tuple[Step, ...]) -> None:
+    # Chains are resampled once instead of several times,
+    # so noisy covers differ slightly.
+    assert diff(transform(cover, steps), apply_steps(cover, steps)).mean() < 2
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        (resize(),),
+        (resize(width=400, height=400),),
+        (fit(400, 400),),
+        (resize(factor=1),),
+    ],
+)
+def test_transform_skips_noops(cover: Image.Image, steps: Tuple[Step, ...]) -> None:
+    assert transform(cover, steps) is cover
+
+
+def test_transform_falls_back_when_box_leaves_image(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # fit rounds 103 * (1000 / 103) down to 999, so the crop
+    # starts before the image and steps are applied one by one.
+    image = Image.linear_gradient("L").resize((103, 103)).convert("RGBA")
+    steps = (fit(1000, 500),)
+    calls: List[Tuple[Step, ...]] = []
+
+    def spy(image: Image.Image, steps: Tuple[Step, ...]) -> Image.Image:
+        calls.append(steps)
+        return apply_steps(image, steps)
+
+    monkeypatch.setattr(geometry, "apply_steps", spy)
+
+    result = transform(image, steps)
+
+    assert calls == [steps]
+    assert diff(result, apply_steps(image, steps)).max() == 0
+
+
+def test_fuse_keeps_shared_prefixes(make_context: ContextFactory) -> None:
+    context = make_context(
+        [
+            {
+                "name": "background",
+                "processors": [
+                    {"name": "fit", "args": {"width": 1920, "height": 1080}},
+                    {"name": "gaussian_blur"},
+                ],
+            },
+            {
+                "name": "cover",
+                "processors": [
+                    {"name": "fit", "args": {"width": 1920, "height": 1080}},
+                    {"name": "resize", "args": {"width": 500, "height": 500}},
+                ],
+            },
+        ],
+    )
+
+    plan = fuse_geometry(build_plan(context.layers, context.variables))
+
+    (root,) = plan.roots
+    assert root.func is transform
+    assert root.processor == "fit"
+    assert [child.processor for child in root.children] == ["gaussian_blur", "resize"]
@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Set
+
+import pytest
+from PIL import Image
+
+from music_bg.img_processors.processor import process_image
+from tests.conftest import ContextFactory
+
+# circle changes its input in place.
+LAYERS = [
+    {"name": "source", "processors": []},
+    {"name": "circled", "processors": [{"name": "circle"}]},
+    {"name": "plain", "processors": [{"name": "noop"}]},
+]
+
+
+def test_in_process_layers_get_own_copies(
+    make_context: ContextFactory,
+    cover: Image.Image,
+) -> None:
+    context = make_context(LAYERS, workers=0)
+    original = cover.tobytes()
+
+    rendered = process_image(cover, context)
+
+    assert rendered is not None
+    assert cover.tobytes() == original
+
+
+def test_in_process_matches_workers(
+    make_context: ContextFactory,
+    cover: Image.Image,
+) -> None:
+    in_process = process_image(cover.copy(), make_context(LAYERS, workers=0))
+    workers = process_image(cover.copy(), make_context(LAYERS, workers=1))
+
+    assert in_process is not None
+    assert workers is not None
+    assert in_process.tobytes() == workers.tobytes()
+
+
+# Blocks of multiprocessing.shared_memory on Linux.
+SHM_DIR = Path("/dev/shm")  # noqa: S108
+
+
+def shared_blocks() -> Set[str]:
+    return {path.name for path in SHM_DIR.glob("psm_*")}
+
+
+def test_failed_branch_frees_shared_images(
+    make_context: ContextFactory,
+    cover: Image.Image,
+    tmp_path: Path,
+) -> None:
+    context = make_context(
+        [
+            *LAYERS,
+            {
+                "name": "missing",
+                "processors": [
+                    {"name": "load_img", "args": {"path": str(tmp_path / "missing")}},
+                ],
+            },
+        ],
+        workers=2,
+    )
+    context.pool.start()
+    before = shared_blocks()
+
+    for _ in range(3):
+        with pytest.raises(FileNotFoundError):
+            process_image(cover.copy(), context)
+
+    assert shared_blocks() == before
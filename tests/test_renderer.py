@@ -0,0 +1,220 @@
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+from PIL import Image
+
+from music_bg import renderer
+from music_bg.bench import synthetic_cover
+from music_bg.context import Context, Metadata, Screen
+from music_bg.renderer import Renderer, render_track
+from tests.conftest import ContextFactory
+
+METADATA = Metadata.model_validate({"mpris:artUrl": "http://example.com/cover.jpg"})
+
+
+@pytest.fixture
+def applied(tmp_path: Path) -> Path:
+    """File where set_command writes wallpapers it was called with."""
+    return tmp_path / "applied.txt"
+
+
+def make_renderer_context(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    cover_bytes: bytes,
+    applied: Path,
+    **options: object,
+) -> Context:
+    layers = options.pop("layers", [{"name": "cover", "processors": []}])
+    context = make_context(
+        layers,
+        workers=0,
+        set_command=f'echo "{{out}}" >> {applied}',
+        **options,
+    )
+    monkeypatch.setattr(context.art_fetcher, "fetch", lambda _url: cover_bytes)
+    return context
+
+
+def applied_paths(applied: Path) -> List[str]:
+    if not applied.exists():
+        return []
+    return applied.read_text().splitlines()
+
+
+def test_preview_scales_loaded_images(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    cover_bytes: bytes,
+    applied: Path,
+    tmp_path: Path,
+) -> None:
+    background = tmp_path / "background.png"
+    Image.new("RGBA", (800, 600), "#336699").save(background)
+    context = make_renderer_context(
+        make_context,
+        monkeypatch,
+        cover_bytes,
+        applied,
+        layers=[
+            {
+                "name": "background",
+                "processors": [{"name": "load_img", "args": {"path": str(background)}}],
+            },
+            {"name": "cover", "processors": []},
+        ],
+        progressive={"enabled": True, "scale": 0.25},
+    )
+
+    render_track(context, METADATA, lambda: False)
+
+    preview, wallpaper = applied_paths(applied)
+    assert Path(preview) == tmp_path / "music_bg-preview.png"
+    assert Path(wallpaper) == tmp_path / "music_bg.png"
+
+
+def test_failed_preview_falls_back_to_full_render(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    cover_bytes: bytes,
+    applied: Path,
+    tmp_path: Path,
+) -> None:
+    context = make_renderer_context(
+        make_context,
+        monkeypatch,
+        cover_bytes,
+        applied,
+        progressive={"enabled": True},
+    )
+
+    def process_images(
+        image: Image.Image,
+        context: Context,
+        screens: List[Screen],
+        scale: float = 1,
+    ) -> List[Image.Image]:
+        if scale != 1:
+            raise ValueError("Layer image bigger than biggest screen.")
+        return original(image, context, screens, scale)
+
+    original = renderer.process_images
+    monkeypatch.setattr(renderer, "process_images", process_images)
+
+    render_track(context, METADATA, lambda: False)
+
+    (wallpaper,) = applied_paths(applied)
+    assert Path(wallpaper) == tmp_path / "music_bg.png"
+    with Image.open(wallpaper) as image:
+        assert image.size == (1920, 1080)
+
+
+def test_prerender_keeps_current_wallpaper(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    cover_bytes: bytes,
+    applied: Path,
+    tmp_path: Path,
+) -> None:
+    context = make_renderer_context(make_context, monkeypatch, cover_bytes, applied)
+    render_track(context, METADATA, lambda: False)
+    (wallpaper,) = applied_paths(applied)
+    assert Path(wallpaper) == tmp_path / "music_bg.png"
+    shown = Path(wallpaper).read_bytes()
+
+    upcoming = synthetic_cover(400, seed=1)
+    monkeypatch.setattr(context.art_fetcher, "fetch", lambda _url: upcoming)
+    render_track(context, METADATA, lambda: False, apply=False)
+
+    assert Path(wallpaper).read_bytes() == shown
+    assert len(applied_paths(applied)) == 1
+    assert len(context.render_cache.entries()) == 2
+    # Private files of the prerender are removed.
+    assert sorted(path.name for path in tmp_path.glob("music_bg*")) == [
+        "music_bg.png",
+    ]
+    assert not [path for path in tmp_path.glob("tmp*") if path.is_dir()]
+
+
+def test_cached_wallpaper_is_set_from_output_path(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    cover_bytes: bytes,
+    applied: Path,
+    tmp_path: Path,
+) -> None:
+    context = make_renderer_context(make_context, monkeypatch, cover_bytes, applied)
+    render_track(context, METADATA, lambda: False)
+    render_track(context, METADATA, lambda: False)
+
+    rendered, cached = applied_paths(applied)
+    assert context.render_cache.hits == 1
+    assert Path(cached) == Path(rendered) == tmp_path / "music_bg.png"
+    context.render_cache.clear()
+    assert Path(cached).exists()
+
+
+@pytest.mark.parametrize("third_party", [False, True])
+def test_variables_get_decoded_cover(
+    make_context: ContextFactory,
+    monkeypatch: pytest.MonkeyPatch,
+    third_party: bool,
+) -> None:
+    context = make_context(
+        [
+            {
+                "name": "cover",
+                "processors": [{"name": "fit", "args": {"width": 200, "height": 200}}],
+            },
+        ],
+        set_command="true {cover_size}" if third_party else "true",
+    )
+    sizes: List[Tuple[int, int]] = []
+
+    def cover_size(context: Context) -> Tuple[int, int]:
+        assert context.src_image is not None
+        sizes.append(context.src_image.size)
+        return context.src_image.size
+
+    context.variables_providers["cover_size"] = cover_size
+    context.reload_config()
+    monkeypatch.setattr(
+        context.art_fetcher,
+        "fetch",
+        lambda _url: synthetic_cover(1600),
+    )
+
+    render_track(context, METADATA, lambda: False)
+
+    assert context.thumbnail is not None
+    assert context.thumbnail.width < 1600
+    assert context.src_image is not None
+    if third_party:
+        # Providers which aren't built in may read the whole cover.
+        assert sizes == [(1600, 1600)]
+        assert context.src_image.size == (1600, 1600)
+    else:
+        assert sizes == []
+        assert context.src_image.size == (200, 200)
+
+
+def test_flush_runs_in_rendering_thread(make_context: ContextFactory) -> None:
+    context = make_context([])
+    renderer = Renderer(context)
+    context.render_cache.put_bytes("wallpaper", b"png")
+    renderer.prefetch([METADATA])
+
+    renderer.flush()
+
+    assert renderer.status()["prefetch_queue"] == []
+    assert context.render_cache.entries()
+    renderer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while context.render_cache.entries() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        renderer.stop()
+    assert context.render_cache.entries() == []
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterator, Tuple, TypeVar
+
+import pytest
+
+from music_bg.context import Context, Metadata
+from music_bg.renderer import Renderer
+from tests.conftest import ContextFactory, RunUntil
+
+pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+from dbus.bus import BusConnection
+from gi.repository import GLib
+
+from music_bg.dbus.players import PlayerTracker
+from music_bg.dbus.service import (
+    BUS_NAME,
+    INTERFACE,
+    OBJECT_PATH,
+    DaemonService,
+    format_status,
+    get_status,
+)
+
+TRACKS = [
+    Metadata.model_validate({"mpris:artUrl": "http://example.com/1.jpg"}),
+    Metadata.model_validate({"mpris:artUrl": "http://example.com/2.jpg"}),
+]
+
+T = TypeVar("T")
+Daemon = Tuple[Context, Renderer, PlayerTracker]
+
+
+@pytest.fixture
+def daemon(
+    tmp_path: Path,
+    make_context: ContextFactory,
+    connect_bus: Callable[[], Any],
+) -> Iterator[Daemon]:
+    """Daemon service exported on the private session bus."""
+    context = make_context([], metrics={"path": str(tmp_path / "metrics.json")})
+    renderer = Renderer(context)
+    tracker = PlayerTracker(context, renderer, GLib.timeout_add)
+    service = DaemonService(connect_bus(), context, renderer, tracker)
+    yield context, renderer, tracker
+    service.remove_from_connection()
+
+
+@pytest.fixture
+def call(
+    bus_address: str,
+    run_until: RunUntil,
+) -> Iterator[Callable[[Callable[[Any], T]], T]]:
+    """
+    Call the daemon like `mbg status` does.
+
+    Clients block until the reply, so they run in another
+    thread while the daemon is dispatched by the GLib loop.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+
+        def client(method: Callable[[Any], T]) -> T:
+            def run() -> T:
+                connection = BusConnection(bus_address)
+                try:
+                    return method(connection)
+                finally:
+                    connection.close()
+
+            future = executor.submit(run)
+            run_until(future.done)
+            return future.result()
+
+        yield client
+
+
+def invoke(name: str) -> Callable[[Any], None]:
+    def method(connection: Any) -> None:
+        daemon = connection.get_object(BUS_NAME, OBJECT_PATH, introspect=False)
+        getattr(daemon, name)(dbus_interface=INTERFACE)
+
+    return method
+
+
+def test_status(daemon: Daemon, call: Callable[..., Any]) -> None:
+    _, renderer, _ = daemon
+    renderer.prefetch(TRACKS)
+
+    status = call(get_status)
+
+    assert status["queue"]["prefetch_queue"] == [track.art_url for track in TRACKS]
+    assert status["caches"]["renders"]["entries"] == 0
+    assert status["players"]["active"] is None
+    assert "prerender queue: 2" in format_status(status)
+
+
+def test_rerender(daemon: Daemon, call: Callable[..., Any]) -> None:
+    _, renderer, tracker = daemon
+
+    call(invoke("Rerender"))
+
+    # Without a playing player the background is reset again.
+    assert tracker.resets == 1
+    assert renderer.status()["pending"] == {
+        "track": None,
+        "reset": True,
+        "prefetch": False,
+    }
+
+
+def test_flush(
+    tmp_path: Path,
+    daemon: Daemon,
+    call: Callable[..., Any],
+    run_until: RunUntil,
+) -> None:
+    context, renderer, _ = daemon
+    renderer.prefetch(TRACKS)
+    context.render_cache.put_bytes("wallpaper", b"png")
+
+    call(invoke("Flush"))
+
+    # The queue is dropped right away, but the cache
+    # is cleared by the rendering thread.
+    assert renderer.status()["prefetch_queue"] == []
+    assert context.render_cache.entries()
+    renderer.start()
+    try:
+        run_until(lambda: not context.render_cache.entries())
+    finally:
+        renderer.stop()
+    assert (tmp_path / "metrics.json").exists()
+
+
+@pytest.mark.parametrize(
+    ("workers", "expected"),
+    [(None, "auto workers"), (0, "0 workers"), (4, "4 workers")],
+)
+def test_status_workers(
+    daemon: Daemon,
+    call: Callable[..., Any],
+    workers: Any,
+    expected: str,
+) -> None:
+    context, _, _ = daemon
+    context.pool.processes = workers
+
+    status = call(get_status)
+
+    assert f"pool: stopped, {expected}" in format_status(status)
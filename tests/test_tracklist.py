@@ -0,0 +1,99 @@
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+from music_bg.dbus.tracklist import (
+    MPRIS_PATH,
+    PROPERTIES_INTERFACE,
+    TRACKLIST_INTERFACE,
+    TrackListPrefetcher,
+)
+from music_bg.renderer import Renderer
+from tests.conftest import ContextFactory, RunUntil
+
+pytest.importorskip("dbus")
+
+import dbus.service
+
+PLAYER_NAME = "org.mpris.MediaPlayer2.fake"
+
+
+def track(track_id: str, art_url: str = "") -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {"mpris:trackid": dbus.ObjectPath(track_id)}
+    if art_url:
+        metadata["mpris:artUrl"] = art_url
+    return metadata
+
+
+class FakePlayer(dbus.service.Object):
+    """Player with `org.mpris.MediaPlayer2.TrackList` interface."""
+
+    def __init__(self, bus: Any, tracks: List[Dict[str, Any]]) -> None:
+        self.tracks = tracks
+        self.requested: List[List[str]] = []
+        self.bus_name = dbus.service.BusName(PLAYER_NAME, bus)
+        super().__init__(self.bus_name, MPRIS_PATH)
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature="ss", out_signature="v")
+    def Get(self, interface: str, name: str) -> Any:  # noqa: N802
+        assert (interface, name) == (TRACKLIST_INTERFACE, "Tracks")
+        return dbus.Array(
+            [metadata["mpris:trackid"] for metadata in self.tracks],
+            signature="o",
+        )
+
+    @dbus.service.method(
+        TRACKLIST_INTERFACE,
+        in_signature="ao",
+        out_signature="aa{sv}",
+    )
+    def GetTracksMetadata(self, track_ids: List[str]) -> List[Dict[str, Any]]:  # noqa: N802
+        self.requested.append([str(track_id) for track_id in track_ids])
+        by_id = {str(metadata["mpris:trackid"]): metadata for metadata in self.tracks}
+        return [by_id[str(track_id)] for track_id in track_ids]
+
+
+def test_upcoming_tracks_are_queued(
+    make_context: ContextFactory,
+    connect_bus: Callable[[], Any],
+    run_until: RunUntil,
+) -> None:
+    context = make_context([], prefetch={"tracks": 2})
+    renderer = Renderer(context)
+    player = FakePlayer(
+        connect_bus(),
+        [
+            track("/track/1", "http://example.com/1.jpg"),
+            track("/track/2", "http://example.com/2.jpg"),
+            track("/track/3"),
+            track("/track/4", "http://example.com/4.jpg"),
+        ],
+    )
+    prefetcher = TrackListPrefetcher(context, renderer, connect_bus())
+
+    prefetcher.refresh(PLAYER_NAME, "/track/1")
+    run_until(lambda: bool(renderer.status()["prefetch_queue"]))
+
+    # Only the configured number of tracks is requested
+    # and tracks without covers are skipped.
+    assert player.requested == [["/track/2", "/track/3"]]
+    assert renderer.status()["prefetch_queue"] == ["http://example.com/2.jpg"]
+
+
+def test_player_without_tracklist(
+    monkeypatch: pytest.MonkeyPatch,
+    make_context: ContextFactory,
+    connect_bus: Callable[[], Any],
+    run_until: RunUntil,
+) -> None:
+    context = make_context([])
+    renderer = Renderer(context)
+    bus = connect_bus()
+    errors: List[Exception] = []
+    prefetcher = TrackListPrefetcher(context, renderer, bus)
+    monkeypatch.setattr(prefetcher, "_on_error", errors.append)
+
+    prefetcher.refresh(bus.get_unique_name(), "/track/1")
+    run_until(lambda: bool(errors))
+
+    assert renderer.status()["prefetch_queue"] == []